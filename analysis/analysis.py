@@ -4,12 +4,17 @@ Initial file to run the CVEDB Analysis
 
 import os
 import sys
+import subprocess
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as plticker
 import json
 import time
+import hashlib
+import functools
+import multiprocessing
+from dataclasses import dataclass
 from tqdm import tqdm
 from dateutil import parser
 from genson import SchemaBuilder
@@ -19,11 +24,129 @@ local_cvedb = f"../cvedb-database/"
 github_advisory_db = "../advisory-database/"
 
 
+"""Typed cache of the entries and counts, kept between runs"""
+cache_dir = "./data/cache/"
+
+
+def get_cvedb_commit(local_cvedb):
+    """
+    Returns the commit the local cvedb-database clone is at
+    :param local_cvedb: Local cvedb-database clone
+    :return: The commit hash, or None if it isn't a git clone
+    """
+    if not os.path.exists(os.path.join(local_cvedb, ".git")):
+        return None
+    return subprocess.run(["git", "-C", local_cvedb, "rev-parse", "HEAD"],
+                          capture_output=True, check=True).stdout.decode().strip()
+
+
+def scan_cvedb_files(local_cvedb, use_git=True):
+    """
+    Returns the paths of all the CVEDB json files, relative to the database, with the hash of their content. The
+    paths and blob hashes come from the tree of HEAD if the database is a git clone, the same commit the caches are
+    keyed by, otherwise the paths come from the year/group_id directories and there are no hashes.
+    :param local_cvedb: Local cvedb-database clone
+    :param use_git: Use git ls-tree when the database is a git clone
+    :return: A dict of year/group_id/file path to blob hash (or None), sorted by path
+    """
+    cvedb_files = {}
+    if use_git and os.path.exists(os.path.join(local_cvedb, ".git")):
+        ls_tree = subprocess.run(["git", "-C", local_cvedb, "ls-tree", "-r", "-z", "HEAD"],
+                                 capture_output=True, check=True).stdout.decode()
+        for line in ls_tree.split("\0"):
+            if "\t" not in line:
+                continue
+            """Each line is <mode> <type> <blob>\t<path>"""
+            info, name = line.split("\t", 1)
+            parts = name.split("/")
+            if len(parts) == 3 and parts[0].isdigit() and parts[2].endswith(".json"):
+                cvedb_files[name] = info.split(" ")[2]
+    else:
+        for year in os.scandir(local_cvedb):
+            if not year.is_dir() or not year.name.isdigit():
+                continue
+            for group_id in os.scandir(year.path):
+                if not group_id.is_dir():
+                    continue
+                for cvedb in os.scandir(group_id.path):
+                    if cvedb.name.endswith(".json"):
+                        cvedb_files[f"{year.name}/{group_id.name}/{cvedb.name}"] = None
+
+    return dict(sorted(cvedb_files.items()))
+
+
+def build_cvedb_list(cvedb_files):
+    """
+    Builds the dataframe of CVEDB entries in one go
+    :param cvedb_files: Dict of CVEDB json path to blob hash
+    :return: A dataframe with the path/year/group_id/cvedb/api/blob of each entry
+    """
+    temp_cvedb_list = pd.DataFrame({"path": pd.Series(list(cvedb_files), dtype=object)})
+
+    """Set the year/group_id/cvedb value for the DF from the three parts of the path"""
+    path_parts = temp_cvedb_list["path"].str.split("/", n=2, expand=True).reindex(columns=range(3)).astype(object)
+    temp_cvedb_list["year"] = pd.to_numeric(path_parts[0]).astype("Int64")
+    temp_cvedb_list["group_id"] = path_parts[1]
+    temp_cvedb_list["cvedb"] = path_parts[2]
+
+    temp_cvedb_list["api"] = "https://raw.globalsecuritydatabase.org/" + temp_cvedb_list["cvedb"].str.slice(0, -5)
+    temp_cvedb_list["blob"] = pd.Series(list(cvedb_files.values()), dtype=object)
+
+    return temp_cvedb_list
+
+
+def refresh_cvedb_list(temp_cvedb_list, cvedb_files):
+    """
+    Brings a previous list of CVEDB entries up to date, only the added and removed paths are touched
+    :param temp_cvedb_list: Dataframe of CVEDB entries from a previous run
+    :param cvedb_files: Dict of the current CVEDB json paths to blob hashes
+    :return: The updated dataframe of CVEDB entries
+    """
+    current_paths = pd.Index(list(cvedb_files))
+    removed = ~temp_cvedb_list["path"].isin(current_paths)
+    added = current_paths[~current_paths.isin(temp_cvedb_list["path"])]
+    print(f"Refreshing the previous CVEDB Entry List: {len(added):,} added, {removed.sum():,} removed.\n")
+
+    temp_cvedb_list = pd.concat([temp_cvedb_list[~removed],
+                                 build_cvedb_list({path: cvedb_files[path] for path in added})])
+    temp_cvedb_list["blob"] = temp_cvedb_list["path"].map(cvedb_files)
+    return temp_cvedb_list.sort_values("path").reset_index(drop=True)
+
+
+def load_cache(name, key=None):
+    """
+    Loads a dataframe from the cache
+    :param name: Name of the cached dataframe
+    :param key: Only load it if it was saved with this key, None loads whatever is there
+    :return: The cached dataframe, or None
+    """
+    if not os.path.exists(f"{cache_dir}{name}.json") or not os.path.exists(f"{cache_dir}{name}.parquet"):
+        return None
+    with open(f"{cache_dir}{name}.json", 'r') as f:
+        cache_info = json.load(f)
+    if key is not None and cache_info["key"] != key:
+        return None
+    return pd.read_parquet(f"{cache_dir}{name}.parquet")
+
+
+def save_cache(name, key, data_frame):
+    """
+    Saves a dataframe to the cache, the key says what it was built from (a commit or the NVD update time)
+    :param name: Name of the cached dataframe
+    :param key: The key to save it with
+    :param data_frame: Dataframe to save
+    :return: None
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    data_frame.to_parquet(f"{cache_dir}{name}.parquet", index=False)
+    with open(f"{cache_dir}{name}.json", 'w') as f:
+        json.dump({"key": key}, f)
+
+
 def get_cvedb_list(local_cvedb):
     """
     Returns a dataframe of all the CVEDB entries.
-    :param file: Known file from previous run so you don't have to parse the CVEDB database again
-    :param saveFile: Save file on an initial run
+    :param local_cvedb: Local cvedb-database clone
     :return: A dataframe of all the CVEDB entries and cvedb_update_time
     """
 
@@ -31,45 +154,26 @@ def get_cvedb_list(local_cvedb):
     temp_cvedb_update_time = open(f'{local_cvedb}nvd_updated_time.txt', 'r').readlines()[0].split(":")[:-1]
     temp_cvedb_update_time = parser.parse("".join(temp_cvedb_update_time))
 
-    """Create a filename to save list of all CVEDB entries"""
-    cvedb_entry_filename = f"./data/cvedb_entries_{str(temp_cvedb_update_time).split(' ')[0].replace('-', '')}.csv"
+    """The cache is keyed by the commit of the database, or the update time if it isn't a clone"""
+    cache_key = get_cvedb_commit(local_cvedb) or str(temp_cvedb_update_time)
 
-    """Check if file exists so we don't have to reload data"""
-    if os.path.exists(cvedb_entry_filename):
-        print(f"Using preexisting CVEDB Entry List: {cvedb_entry_filename}\n")
-        temp_cvedb_list = pd.read_csv(cvedb_entry_filename)
+    """Check if the cache is up to date so we don't have to reload data"""
+    temp_cvedb_list = load_cache("cvedb_entries", cache_key)
+    if temp_cvedb_list is not None:
+        print(f"Using cached CVEDB Entry List for {cache_key}\n")
     else:
         print(f"Scanning the cvedb-database for potential CVEDB entries.\n")
-        """Get list of available years within CVEDB"""
-        cvedb_years = [name for name in os.listdir(local_cvedb) if os.path.isdir(os.path.join(local_cvedb, name))]
-        cvedb_years = [name for name in cvedb_years if "." not in name]
-        cvedb_years.sort()
-
-        """Base DF to hold data"""
-        temp_cvedb_list = pd.DataFrame(columns=["path"])
-
-        """Walk through the cvedb-database and obtain the CVEDB json files"""
-        for r, d, f in os.walk(local_cvedb):
-            if r.split("/")[-2] in cvedb_years:
-                temp_cvedb_file = [f"{r}/{cvedb}" for cvedb in f]
-                temp_cvedb = pd.DataFrame(temp_cvedb_file, columns=["path"])
-                temp_cvedb_list = pd.concat([temp_cvedb_list, temp_cvedb])
-
-        """Set the year/group_id/cvedb value for the DF"""
-        temp_cvedb_list["year"] = temp_cvedb_list.apply(lambda row: row["path"].split("/")[-3], axis=1)
-        temp_cvedb_list["group_id"] = temp_cvedb_list.apply(lambda row: row["path"].split("/")[-2], axis=1)
-        temp_cvedb_list["cvedb"] = temp_cvedb_list.apply(lambda row: row["path"].split("/")[-1], axis=1)
-
-        temp_cvedb_list["api"] = temp_cvedb_list.apply(
-            lambda x: f"https://raw.globalsecuritydatabase.org/{x['path'].split('/')[-1].strip('.json')}",
-            axis=1)
+        cvedb_files = scan_cvedb_files(local_cvedb)
 
-        """Reset the index"""
-        temp_cvedb_list = temp_cvedb_list.reset_index(drop=True)
+        """Start from the list we saved before if there is one"""
+        temp_cvedb_list = load_cache("cvedb_entries")
+        if temp_cvedb_list is not None:
+            temp_cvedb_list = refresh_cvedb_list(temp_cvedb_list, cvedb_files)
+        else:
+            temp_cvedb_list = build_cvedb_list(cvedb_files)
 
-        print(f"Saving CVEDB entries CSV to: {cvedb_entry_filename}")
-        """Save file if desired"""
-        temp_cvedb_list.to_csv(cvedb_entry_filename, encoding='utf-8', index=False)
+        print(f"Saving CVEDB entries to: {cache_dir}cvedb_entries.parquet")
+        save_cache("cvedb_entries", cache_key, temp_cvedb_list)
 
     print(f"Total CVEDB Entries: {len(temp_cvedb_list):,}.\n"
           f"CVEDB Timestamp: {temp_cvedb_update_time}\n")
@@ -97,46 +201,14 @@ def get_github_advisory_db_list():
     return temp_advisories_list
 
 
-def visualize_cvedb(cvedb_items, cvedb_counts, analysis_date):
+def visualize_cvedb(total_counts, analysis_date):
     """
     Create a figure of the CVEDB item counts by year
-    :param cvedb_items: Dataframe of CVEDB entries
-    :param cvedb_items: Dataframe of CVEDB counts for each objects
+    :param total_counts: Dataframe of CVEDB counts by year, from get_year_counts
     :param analysis_date: Date of CVEDB NVD update time
     :return: None
     """
 
-    cvedb_counts["year"] = cvedb_counts.apply(lambda x: int(x['path'].split("/")[2]), axis=1)
-
-    """Count by year"""
-    cvedb_year_counts = cvedb_items["year"].value_counts().rename_axis('year').reset_index(name='counts').sort_values(
-        'year')
-    cve_year_counts = cvedb_counts[cvedb_counts["cve.org"] == 1]["year"].value_counts().rename_axis('year').reset_index(
-        name='cve_counts').sort_values('year')
-    nvd_year_counts = cvedb_counts[cvedb_counts["nvd.nist.gov"] == 1]["year"].value_counts().rename_axis(
-        'year').reset_index(
-        name='nvd_counts').sort_values('year')
-    gitlab_year_counts = cvedb_counts[cvedb_counts["gitlab.com"] == 1]["year"].value_counts().rename_axis(
-        'year').reset_index(
-        name='gitlab_counts').sort_values('year')
-    osv_year_counts = cvedb_counts[cvedb_counts["OSV"] == 1]["year"].value_counts().rename_axis('year').reset_index(
-        name='osv_counts').sort_values('year')
-    cisa_year_counts = cvedb_counts[cvedb_counts["cisa.gov"] == 1]["year"].value_counts().rename_axis('year').reset_index(
-        name='cisa_counts').sort_values('year')
-
-    """Combine each object type to a single DF"""
-    total_counts = pd.merge(cvedb_year_counts, osv_year_counts,
-                            on="year",
-                            how="outer")
-
-    total_counts = total_counts.merge(cisa_year_counts, on="year", how="outer")
-    total_counts = total_counts.merge(cve_year_counts, on="year", how="outer")
-    total_counts = total_counts.merge(gitlab_year_counts, on="year", how="outer")
-    total_counts = total_counts.merge(nvd_year_counts, on="year", how="outer")
-
-    """Fill any empty columns"""
-    total_counts = total_counts.fillna(0)
-
     """Create a figure of the size of CVEDB by year"""
     fig, ax = plt.subplots(figsize=(8, 6))
     ax.plot([], [], ' ', label=f"CVEDB Timestamp: {analysis_date}")
@@ -151,12 +223,12 @@ def visualize_cvedb(cvedb_items, cvedb_counts, analysis_date):
             label=f"CISA: {int(total_counts['cisa_counts'].sum()):,}")
 
     """Set some labels"""
-    ax.set_xlim(cvedb_year_counts["year"].min(), cvedb_year_counts["year"].max())
+    ax.set_xlim(total_counts["year"].min(), total_counts["year"].max())
     ax.set_ylim(0)
     plt.xticks(rotation=75)
     loc = plticker.MultipleLocator(base=1.0)  # this locator puts ticks at regular intervals
     ax.xaxis.set_major_locator(loc)
-    plt.yticks(np.arange(0, cvedb_year_counts["counts"].max() + 5000, 5000))
+    plt.yticks(np.arange(0, total_counts["counts"].max() + 5000, 5000))
     ax.get_yaxis().set_major_formatter(plticker.FuncFormatter(lambda x, p: format(int(x), ',')))
     ax.set_ylabel('Count')
     ax.set_title(f'Count of CVEDB Entries by Year')
@@ -174,148 +246,298 @@ def visualize_cvedb(cvedb_items, cvedb_counts, analysis_date):
     plt.savefig("./data/figs/cvedb_total_count.png", bbox_inches="tight")
 
 
-def generate_complete_cvedb_schema(cvedb_items_complete, analysis_date):
+"""Namespaces we count, and where each one keeps its ID"""
+NAMESPACE_COLUMNS = {
+    "cve.org": ("cve_org_id", ("cve.org", "CVE_data_meta", "ID")),
+    "nvd.nist.gov": ("nvd_id", ("nvd.nist.gov", "cve", "CVE_data_meta", "ID")),
+    "cisa.gov": ("cisa_id", ("cisa.gov", "cveID")),
+    "gitlab.com": ("gitlab_id", ("gitlab.com", "advisories", 0, "identifier")),
+    "github.com/kurtseifried:582211": (None, None),
+}
+
+"""Checklist columns that are 0/1 flags"""
+FLAG_COLUMNS = ["missingCVEDB", "CVEDB", "OSV", "overlay"] + list(NAMESPACE_COLUMNS)
+
+
+def get_value(data, keys):
+    """
+    Follows a list of keys/indexes into a JSON object
+    :param data: The loaded JSON
+    :param keys: Keys and list indexes to follow
+    :return: The value, or None if any part of the path is missing
+    """
+    for key in keys:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+
+def check_cvedb(path, data):
+    """
+    Returns the counts of the various object types in a single CVEDB entry. Only the top level keys and the keys of
+    the namespaces object are looked at, so a namespace mentioned in a description doesn't count.
+    :param path: Path of the CVEDB json
+    :param data: The loaded CVEDB json
+    :return: A dict with one value per checklist column
     """
-    Generates a complete CVEDB schema for all possible data entries
+    if not isinstance(data, dict):
+        data = {}
+    namespaces = data.get("namespaces")
+    if not isinstance(namespaces, dict):
+        namespaces = {}
+
+    temp_check_values = {"path": path}
+
+    """Identify any JSONs with and without a CVEDB object"""
+    if "CVEDB" in data:
+        temp_check_values["missingCVEDB"] = 0
+        temp_check_values["CVEDB"] = 1
+        temp_check_values["CVEDB_alias"] = get_value(data, ("CVEDB", "alias"))
+        if temp_check_values["CVEDB_alias"] is None:
+            temp_check_values["CVEDB_alias"] = "Missing"
+    else:
+        temp_check_values["missingCVEDB"] = 1
+        temp_check_values["CVEDB"] = 0
+        temp_check_values["CVEDB_alias"] = None
+
+    """Identify any JSONs with a OSV or overlay object"""
+    temp_check_values["OSV"] = int("OSV" in data)
+    temp_check_values["overlay"] = int("overlay" in data)
+
+    """Identify the namespaces and pull out their IDs"""
+    for namespace, (id_column, id_keys) in NAMESPACE_COLUMNS.items():
+        temp_check_values[namespace] = int(namespace in namespaces)
+        if id_column is not None:
+            temp_check_values[id_column] = get_value(namespaces, id_keys)
+
+    return temp_check_values
+
+
+def parse_cvedb_shard(local_cvedb, cvedb_paths):
+    """
+    Parses a shard of CVEDB entries in a worker process
+    :param local_cvedb: Local cvedb-database clone
+    :param cvedb_paths: List of CVEDB json paths relative to the database
+    :return: The partial Genson schema of the shard and a list of checklist rows
+    """
+    builder = SchemaBuilder()
+    rows = []
+    for path in cvedb_paths:
+        with open(os.path.join(local_cvedb, path), 'r') as f:
+            data = json.load(f)
+        builder.add_object(data)
+        rows.append(check_cvedb(path, data))
+
+    return builder.to_schema(), rows
+
+
+def get_cvedb_directory(paths):
+    """
+    Returns the year/group_id directory of each CVEDB json path
+    :param paths: Series of CVEDB json paths
+    :return: Series of directories
+    """
+    return paths.str.rsplit("/", n=1).str[0]
+
+
+def get_directory_fingerprints(cvedb_items):
+    """
+    Fingerprints each year/group_id directory by the paths and blob hashes of its files, so a directory with an
+    added, removed or changed file gets a new fingerprint
+    :param cvedb_items: Dataframe with the path and blob of each CVEDB entry
+    :return: A dict of directory to fingerprint
+    """
+    entries = pd.DataFrame({"directory": get_cvedb_directory(cvedb_items["path"]),
+                            "entry": cvedb_items["path"] + " " + cvedb_items["blob"].fillna("")})
+    return {directory: hashlib.sha1("\n".join(sorted(group)).encode()).hexdigest()
+            for directory, group in entries.groupby("directory")["entry"]}
+
+
+def parse_cvedb_entries(cvedb_paths, workers=None, local_cvedb=""):
+    """
+    Parses the CVEDB entries across a pool of processes. Each worker builds the schema and rows for one year/group_id
+    directory at a time, so the schemas can be cached and replaced a directory at a time.
+    :param cvedb_paths: List of CVEDB json paths relative to local_cvedb
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param local_cvedb: Local cvedb-database clone
+    :return: A dict of directory to Genson schema and a checklist dataframe
+    """
+    schemas = {}
+    rows = []
+
+    paths = pd.Series(cvedb_paths, dtype=object)
+    directories = []
+    shards = []
+    for directory, group in paths.groupby(get_cvedb_directory(paths)):
+        directories.append(directory)
+        shards.append(group.tolist())
+
+    """Use tqdm to create a nice progress bar instead of printing the index of each JSON"""
+    with tqdm(total=len(cvedb_paths)) as pbar:
+        with multiprocessing.Pool(workers) as pool:
+            parse_shard = functools.partial(parse_cvedb_shard, local_cvedb)
+            for directory, shard, (schema, shard_rows) in zip(directories, shards, pool.imap(parse_shard, shards)):
+                schemas[directory] = schema
+                rows.extend(shard_rows)
+                pbar.update(len(shard))
+
+    master_checklist = pd.DataFrame(rows)
+    if len(master_checklist) > 0:
+        master_checklist = master_checklist.astype({column: "int8" for column in FLAG_COLUMNS})
+
+    return schemas, master_checklist
+
+
+def generate_complete_cvedb_schema(cvedb_items_complete, analysis_date, workers=None, local_cvedb=None):
+    """
+    Generates a complete CVEDB schema for all possible data entries. The schema and counts are cached for each
+    year/group_id directory, only the directories with new, changed or removed files get parsed again. The complete
+    schema is merged from the directory schemas every time, so objects from removed files drop out of it.
     :param cvedb_items_complete: Dataframe of CVEDB entries
     :param analysis_date: Timestamp from CVEDB database locally cloned repo
+    :param workers: Number of worker processes used to parse the CVEDB entries
+    :param local_cvedb: Local cvedb-database clone the paths are relative to, the cache is keyed by its commit
     :return: CVEDB schema and checklist of various counts
     """
-    """Create a filename to save counts entries"""
-    cvedb_counts_filename = f"./data/cvedb_counts_{str(analysis_date).split(' ')[0].replace('-', '')}.csv"
-
-    # Check if schema and master_checklist already exists so we don't have to re-run
-    if os.path.exists(f"./data/schemas/cvedb_complete_schema.json") and os.path.exists(cvedb_counts_filename):
-        print(f"Using preexisting schema (./data/schemas/cvedb_complete_schema.json) and counts ({cvedb_counts_filename}) "
-              f"files.")
-        with open(f"./data/schemas/cvedb_complete_schema.json", 'r') as f:
-            schema = json.load(f)
-            f.close()
-        master_checklist = pd.read_csv(cvedb_counts_filename)
+    cache_key = str(analysis_date)
+    if local_cvedb is not None:
+        cache_key = get_cvedb_commit(local_cvedb) or cache_key
     else:
-        print(f"Parsing each CVEDB ({len(cvedb_items_complete):,}) to build a schema and generate a general counts file:")
-        """"Hold the complete schema"""
-        builder = SchemaBuilder()
-
-        """Holds various counts of the various object types in the CVEDB"""
-        master_checklist = pd.DataFrame()
-
-        """Use tqdm to create a nice progress bar instead of printing the index of each JSON"""
-        with tqdm(total=len(cvedb_items_complete)) as pbar:
-            """Loop through each CVEDB entry, loads the JSON, adding object to Genson Schema, 
-            creating a master dataframe"""
-            for index, cvedb in cvedb_items_complete.iterrows():
-                # print(f"{index}/{len(cvedb_items_complete)}")
-                with open(cvedb["path"], 'r') as f:
-                    data = json.load(f)
-
-                    builder.add_object(data)
-
-                    temp_check_values = pd.DataFrame([cvedb["path"]], columns=["path"])
-
-                    """Identify any JSONs without a CVEDB object"""
-                    if '\'CVEDB\':' not in str(data):
-                        temp_check_values["missingCVEDB"] = 1
-                    else:
-                        temp_check_values["missingCVEDB"] = 0
-
-                    """Identify any JSONs with a CVEDB object"""
-                    if '\'CVEDB\':' in str(data):
-                        temp_check_values["CVEDB"] = 1
-                        try:
-                            temp_check_values["CVEDB_alias"] = data["CVEDB"]["alias"]
-                        except:
-                            temp_check_values["CVEDB_alias"] = "Missing"
-                    else:
-                        temp_check_values["CVEDB"] = 0
-                        temp_check_values["CVEDB_alias"] = None
-
-                    """Identify any JSONs with a OSV object"""
-                    if '\'OSV\':' in str(data):
-                        temp_check_values["OSV"] = 1
-                    else:
-                        temp_check_values["OSV"] = 0
-
-                    """Identify any JSONs with a overlay object"""
-                    if '\'overlay\':' in str(data):
-                        temp_check_values["overlay"] = 1
-                    else:
-                        temp_check_values["overlay"] = 0
-
-                    """Identify any JSONs with a cve.org object"""
-                    if '\'cve.org\':' in str(data):
-                        temp_check_values["cve.org"] = 1
-                        try:
-                            temp_check_values["cve_org_id"] = data["namespaces"]["cve.org"]["CVE_data_meta"]["ID"]
-                        except:
-                            temp_check_values["cve_org_id"] = None
-                    else:
-                        temp_check_values["cve.org"] = 0
-                        temp_check_values["cve_org_id"] = None
-
-                    """Identify any JSONs with a nvd.nist.gov object"""
-                    if '\'nvd.nist.gov\':' in str(data):
-                        temp_check_values["nvd.nist.gov"] = 1
-                        try:
-                            temp_check_values["nvd_id"] = data["namespaces"]["nvd.nist.gov"]["cve"]["CVE_data_meta"]["ID"]
-                        except:
-                            temp_check_values["nvd_id"] = None
-                    else:
-                        temp_check_values["nvd.nist.gov"] = 0
-                        temp_check_values["nvd_id"] = None
-
-                    """Identify any JSONs with a cisa object"""
-                    if '\'cisa.gov\':' in str(data):
-                        temp_check_values["cisa.gov"] = 1
-                        try:
-                            temp_check_values["cisa_id"] = data["namespaces"]["cisa.gov"]["cveID"]
-                        except:
-                            temp_check_values["cisa_id"] = None
-                    else:
-                        temp_check_values["cisa.gov"] = 0
-                        temp_check_values["cisa_id"] = None
-
-                    """Identify any JSONs with a gitlab.com object"""
-                    if '\'gitlab.com\':' in str(data):
-                        temp_check_values["gitlab.com"] = 1
-                        try:
-                            temp_check_values["gitlab_id"] = data["namespaces"]["gitlab.com"]["advisories"][0]["identifier"]
-                        except:
-                            temp_check_values["gitlab_id"] = None
-                    else:
-                        temp_check_values["gitlab.com"] = 0
-                        temp_check_values["gitlab_id"] = None
-
-                    """Checking for CVEDB JSONs with the following key"""
-                    if "github.com/kurtseifried:582211" in str(data):
-                        temp_check_values["github.com/kurtseifried:582211"] = 1
-                    else:
-                        temp_check_values["github.com/kurtseifried:582211"] = 0
-
-                    master_checklist = pd.concat([master_checklist, temp_check_values])
-
-                    f.close()
-
-                    """Updated the progress bar by 1"""
-                    pbar.update(1)
-        """Close the progress bar"""
-        pbar.close()
-
-        schema = builder.to_schema()["properties"]
-
-        """Save complete schema"""
+        local_cvedb = ""
+    schema_filename = f"{cache_dir}cvedb_schema.json"
+
+    """Start from the directory schemas and counts we saved before"""
+    master_checklist = load_cache("cvedb_counts")
+    directory_schemas = {}
+    if master_checklist is not None and os.path.exists(schema_filename):
+        with open(schema_filename, 'r') as f:
+            directory_schemas = json.load(f).get("directories", {})
+
+    """Without blob hashes the cache can only be reused for the same database"""
+    if cvedb_items_complete["blob"].isna().any() and load_cache("cvedb_counts", cache_key) is None:
+        directory_schemas = {}
+    if master_checklist is None or len(directory_schemas) == 0:
+        master_checklist = pd.DataFrame(columns=["path", "blob"])
+        directory_schemas = {}
+
+    """Keep the directories that are still there and haven't changed"""
+    fingerprints = get_directory_fingerprints(cvedb_items_complete)
+    unchanged = [directory for directory in directory_schemas
+                 if fingerprints.get(directory) == directory_schemas[directory]["fingerprint"]]
+    changed = len(unchanged) < len(directory_schemas)
+    directory_schemas = {directory: directory_schemas[directory] for directory in unchanged}
+    master_checklist = master_checklist[get_cvedb_directory(master_checklist["path"]).isin(unchanged).values]
+    current = cvedb_items_complete[["path", "blob"]]
+    to_parse = current[~get_cvedb_directory(current["path"]).isin(unchanged)]
+
+    if len(to_parse) > 0 or changed:
+        print(f"Parsing each new or changed CVEDB ({len(to_parse):,} of {len(current):,}) to build a schema and "
+              f"generate a general counts file:")
+        if len(to_parse) > 0:
+            """Holds the schema and various counts of the various object types in the parsed CVEDB entries"""
+            parsed_schemas, parsed_checklist = parse_cvedb_entries(to_parse["path"].tolist(), workers, local_cvedb)
+            for directory, schema in parsed_schemas.items():
+                directory_schemas[directory] = {"fingerprint": fingerprints[directory], "schema": schema}
+
+            parsed_checklist = parsed_checklist.merge(to_parse, on="path")
+            parsed_checklist["api"] = ("https://raw.globalsecuritydatabase.org/" +
+                                       parsed_checklist["path"].str.rsplit("/", n=1).str[-1].str.slice(0, -5))
+            if len(master_checklist) > 0:
+                master_checklist = pd.concat([master_checklist, parsed_checklist])
+            else:
+                master_checklist = parsed_checklist
+        master_checklist = master_checklist.sort_values("path").reset_index(drop=True)
+
+    """The complete schema is the merge of the schema of every directory"""
+    builder = SchemaBuilder()
+    for directory in sorted(directory_schemas):
+        builder.add_schema(directory_schemas[directory]["schema"])
+
+    if len(to_parse) > 0 or changed:
+        """Save the directory schemas for the next run, and the properties for the schema files"""
+        save_cache("cvedb_counts", cache_key, master_checklist)
+        with open(schema_filename, "w") as schema_file:
+            json.dump({"directories": directory_schemas}, schema_file)
         with open("./data/schemas/cvedb_complete_schema.json", "w") as schema_file:
-            json.dump(schema, schema_file, indent=4, sort_keys=True)
-
-        master_checklist["api"] = master_checklist.apply(
-            lambda x: f"https://raw.globalsecuritydatabase.org/{x['path'].split('/')[-1].strip('.json')}",
-            axis=1)
+            json.dump(builder.to_schema()["properties"], schema_file, indent=4, sort_keys=True)
+    else:
+        print(f"Using cached schema ({schema_filename}) and counts ({cache_dir}cvedb_counts.parquet).")
 
-        master_checklist.to_csv(cvedb_counts_filename, encoding='utf-8', index=False)
+    schema = builder.to_schema()["properties"]
 
     return schema, master_checklist
 
 
+"""Columns of the per year counts for each source"""
+YEAR_COUNT_COLUMNS = {
+    "OSV": "osv_counts",
+    "cisa.gov": "cisa_counts",
+    "cve.org": "cve_counts",
+    "gitlab.com": "gitlab_counts",
+    "nvd.nist.gov": "nvd_counts",
+}
+
+
+@dataclass
+class ConsistencyReport:
+    """
+    Results of consistency_report, each mismatch is a dataframe of the CVEDB entries with that problem
+    """
+    duplicates: pd.DataFrame
+    cvedb_vs_cve_org: pd.DataFrame
+    cvedb_vs_nvd: pd.DataFrame
+    cve_vs_nvd: pd.DataFrame
+    duplicate_cve_org_ids: pd.DataFrame
+    year_counts: pd.DataFrame
+
+
+def get_year_counts(cvedb_counts):
+    """
+    Counts the CVEDB entries, and the entries with each source, by year in one groupby
+    :param cvedb_counts: Dataframe of CVEDB counts for each objects
+    :return: A dataframe with a year column, a counts column for all entries and one column per source
+    """
+    years = pd.to_numeric(cvedb_counts["path"].str.split("/", n=1).str[0]).rename("year")
+    aggregations = {"counts": ("path", "size")}
+    for column, count_column in YEAR_COUNT_COLUMNS.items():
+        aggregations[count_column] = (column, "sum")
+
+    return cvedb_counts.groupby(years).agg(**aggregations).reset_index().sort_values("year")
+
+
+def consistency_report(cvedb_df):
+    """
+    Checks the CVEDB entries for duplicate aliases and for IDs that don't match between the sources
+    :param cvedb_df: Dataframe of CVEDB counts for each objects
+    :return: A ConsistencyReport
+    """
+    cvedb_alias = cvedb_df["CVEDB_alias"]
+    has_alias = cvedb_alias.notna() & (cvedb_alias != "Missing")
+    has_cve_org = cvedb_df["cve.org"] == 1
+    has_nvd = cvedb_df["nvd.nist.gov"] == 1
+
+    """Checking for CVEDB alias duplicates"""
+    alias_counts = cvedb_alias[has_alias].value_counts()
+    duplicate_alias = has_alias & cvedb_alias.map(alias_counts).gt(1)
+    duplicates = cvedb_df[duplicate_alias].assign(cve=cvedb_alias[duplicate_alias],
+                                                  count=cvedb_alias[duplicate_alias].map(alias_counts))
+
+    """Checking for cve.org IDs used by more than one CVEDB entry"""
+    cve_org_counts = cvedb_df["cve_org_id"].value_counts().rename_axis("cve").reset_index(name="count")
+
+    """Comparing the IDs a whole column at a time, a missing ID never matches"""
+    return ConsistencyReport(
+        duplicates=duplicates.sort_values(["cve", "path"]),
+        cvedb_vs_cve_org=cvedb_df[has_cve_org & (cvedb_alias != "Missing") & ~cvedb_alias.eq(cvedb_df["cve_org_id"])],
+        cvedb_vs_nvd=cvedb_df[has_nvd & (cvedb_alias != "Missing") & ~cvedb_alias.eq(cvedb_df["nvd_id"])],
+        cve_vs_nvd=cvedb_df[has_cve_org & has_nvd & ~cvedb_df["cve_org_id"].eq(cvedb_df["nvd_id"])],
+        duplicate_cve_org_ids=cve_org_counts[cve_org_counts["count"] > 1],
+        year_counts=get_year_counts(cvedb_df),
+    )
+
+
 if __name__ == '__main__':
     start = time.time()
 
@@ -332,46 +554,26 @@ if __name__ == '__main__':
     # github_advisories = get_github_advisory_db_list()
 
     """Generate Schemas for CVEDB"""
-    complete_schema, cvedb_df = generate_complete_cvedb_schema(cvedb_list, cvedb_update_time)
+    complete_schema, cvedb_df = generate_complete_cvedb_schema(cvedb_list, cvedb_update_time, local_cvedb=local_cvedb)
+
+    """Check the CVEDB entries against each other and the other sources"""
+    report = consistency_report(cvedb_df)
 
     """Figure for CVEDB Entries by Year"""
-    visualize_cvedb(cvedb_list, cvedb_df, cvedb_update_time)
+    visualize_cvedb(report.year_counts, cvedb_update_time)
 
     """============================================================================================================"""
     """============================================================================================================"""
     print("Running some general analysis: \n")
 
-    """Checking for CVEDB alias duplicates"""
-    cvedb_alias_cve = cvedb_df["CVEDB_alias"].value_counts().rename_axis('cve').reset_index(name='count')
-    cvedb_alias_cve = cvedb_alias_cve[(cvedb_alias_cve["count"] > 1) & (cvedb_alias_cve['cve'] != "Missing")]
-    duplicates = pd.merge(cvedb_df, cvedb_alias_cve,
-                          left_on="CVEDB_alias",
-                          right_on="cve",
-                          how="inner")
-    print(f"Duplicate CVEs with differing CVEDB entries: {len(duplicates)}")
-    for each in duplicates[["cve", "api"]].values.tolist():
+    print(f"Duplicate CVEs with differing CVEDB entries: {len(report.duplicates)}")
+    for each in report.duplicates[["cve", "api"]].values.tolist():
         print(f"{each[0]}: {each[1]}")
 
-    """Checking when CVEDB alias != cve.org CVE"""
-    cvedb_df["cvedb_vs_cve_org"] = cvedb_df.apply(lambda x: 1 if x['CVEDB_alias'] == x['cve_org_id'] else 0, axis=1)
-    cvedb_mismatch = cvedb_df[(cvedb_df["cvedb_vs_cve_org"] == 0)
-                          & (cvedb_df['cve.org'] == 1)
-                          & (cvedb_df['CVEDB_alias'] != "Missing")]
-
-    """Checking when CVEDB alias != nvd CVE"""
-    cvedb_df["cvedb_vs_nvd"] = cvedb_df.apply(lambda x: 1 if x['CVEDB_alias'] == x['nvd_id'] else 0, axis=1)
-    cvedb_nvd_mismatch = cvedb_df[(cvedb_df["cvedb_vs_nvd"] == 0)
-                              & (cvedb_df['nvd.nist.gov'] == 1)
-                              & (cvedb_df['CVEDB_alias'] != "Missing")]
-
-    """Checking when cve.org != nvd CVE"""
-    cvedb_df["cve_vs_nvd"] = cvedb_df.apply(lambda x: 1 if x['cve_org_id'] == x['nvd_id'] else 0, axis=1)
-    cve_nvd_mismatch = cvedb_df[(cvedb_df["cve_vs_nvd"] == 0)
-                              & (cvedb_df['nvd.nist.gov'] == 1)
-                              & (cvedb_df['cve.org'] == 1)]
-
-    nvd_cve = cvedb_df["cve_org_id"].value_counts().rename_axis('cve').reset_index(name='count')
-    nvd_cve = nvd_cve[nvd_cve["count"] > 1]
+    print(f"CVEDB alias != cve.org CVE: {len(report.cvedb_vs_cve_org)}")
+    print(f"CVEDB alias != nvd CVE: {len(report.cvedb_vs_nvd)}")
+    print(f"cve.org != nvd CVE: {len(report.cve_vs_nvd)}")
+    print(f"cve.org CVEs in more than one CVEDB entry: {len(report.duplicate_cve_org_ids)}\n")
     """============================================================================================================"""
     """============================================================================================================"""
 
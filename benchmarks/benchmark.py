@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import platform
+import datetime
+import subprocess
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmark_dir, "..", "bot"))
+sys.path.insert(0, os.path.join(benchmark_dir, "..", "analysis"))
+
+import corpus
+import CVEDB
+import analysis
+
+# Times the hot paths of the bot and the analysis against a synthetic
+# database (see corpus.py) and prints the results as JSON, so runs from
+# different releases can be compared.
+#
+# Usage: benchmark.py [--records 10000,100000] [--output results.json]
+
+def add_summary(the_id, the_data):
+    # The same kind of change helpers/add-osv-summary.py makes
+    if the_data["OSV"]["summary"] == the_data["CVEDB"]["description"][0:60]:
+        return None
+    the_data["OSV"]["summary"] = the_data["CVEDB"]["description"][0:60]
+    return the_data
+
+class Benchmark:
+
+    def __init__(self, records, work_dir, workers=None):
+        self.records = records
+        self.work_dir = work_dir
+        self.workers = workers
+        self.results = []
+
+    def timed(self, name, func, iterations=1):
+        start_time = time.perf_counter()
+        for i in range(iterations):
+            result = func()
+        seconds = time.perf_counter() - start_time
+
+        self.results.append({
+            "name": name,
+            "records": self.records,
+            "iterations": iterations,
+            "seconds": seconds,
+            "seconds_per_iteration": seconds / iterations
+        })
+        print("%s (%d records): %.3fs" % (name, self.records, seconds), file=sys.stderr)
+        return result
+
+    def run_bot(self, origin_dir, repo_dir):
+        year = str(datetime.datetime.now().year)
+
+        cvedb_repo = self.timed("CVEDBRepo.clone",
+                                lambda: CVEDB.CVEDBRepo(origin_dir, testing=True, repo_dir=repo_dir))
+        self.timed("CVEDBRepo.get_next_cvedb_path", cvedb_repo.get_next_cvedb_path, 100)
+        self.timed("CVEDBRepo.get_all_ids", cvedb_repo.get_all_ids)
+        self.timed("CVEDBRepo.get_all_ids(year)", lambda: cvedb_repo.get_all_ids(years=year), 10)
+        self.timed("CVEDBRepo.get_all_ids(manifest, cold)", lambda: cvedb_repo.get_all_ids(manifest=True))
+        self.timed("CVEDBRepo.get_all_ids(manifest, warm)", lambda: cvedb_repo.get_all_ids(manifest=True))
+        return cvedb_repo
+
+    def run_bulk(self, cvedb_repo):
+        self.timed("CVEDBRepo.bulk_rewrite(dry_run)",
+                   lambda: cvedb_repo.bulk_rewrite(add_summary, self.workers, dry_run=True))
+        self.timed("CVEDBRepo.bulk_rewrite",
+                   lambda: cvedb_repo.bulk_rewrite(add_summary, self.workers))
+
+    def run_analysis(self, repo_dir):
+        # analysis.py keeps its caches and schemas under ./data
+        analysis_dir = os.path.join(self.work_dir, "analysis")
+        os.makedirs(os.path.join(analysis_dir, "data", "schemas"), exist_ok=True)
+        old_dir = os.getcwd()
+        os.chdir(analysis_dir)
+        try:
+            local_cvedb = repo_dir + "/"
+            (cvedb_list, update_time) = self.timed("analysis.get_cvedb_list(cold)",
+                                                   lambda: analysis.get_cvedb_list(local_cvedb))
+            self.timed("analysis.get_cvedb_list(warm)", lambda: analysis.get_cvedb_list(local_cvedb))
+            (schema, cvedb_df) = self.timed("analysis.generate_complete_cvedb_schema(cold)",
+                                            lambda: analysis.generate_complete_cvedb_schema(cvedb_list, update_time,
+                                                                                            self.workers, local_cvedb))
+            self.timed("analysis.generate_complete_cvedb_schema(warm)",
+                       lambda: analysis.generate_complete_cvedb_schema(cvedb_list, update_time, self.workers,
+                                                                       local_cvedb))
+            self.timed("analysis.consistency_report", lambda: analysis.consistency_report(cvedb_df))
+        finally:
+            os.chdir(old_dir)
+
+    def run(self):
+        origin_dir = os.path.join(self.work_dir, "origin")
+        repo_dir = os.path.join(self.work_dir, "checkout")
+
+        self.timed("corpus.generate", lambda: corpus.generate(origin_dir, self.records))
+        cvedb_repo = self.run_bot(origin_dir, repo_dir)
+        self.run_analysis(repo_dir)
+        # The rewrite changes the files, so it goes last
+        self.run_bulk(cvedb_repo)
+        return self.results
+
+def get_tools_commit():
+    try:
+        return subprocess.run(["git", "-C", benchmark_dir, "rev-parse", "HEAD"],
+                              capture_output=True, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the CVEDB bot and analysis")
+    arg_parser.add_argument("--records", default="10000",
+                            help="Comma separated sizes of the synthetic database, e.g. 10000,100000,1000000")
+    arg_parser.add_argument("--workers", type=int, default=None, help="Worker processes for the bulk jobs")
+    arg_parser.add_argument("--work-dir", default=None, help="Keep the databases here instead of a temp directory")
+    arg_parser.add_argument("--output", default=None, help="Write the JSON here instead of stdout")
+    args = arg_parser.parse_args()
+
+    report = {
+        "started": datetime.datetime.utcnow().isoformat() + "Z",
+        "commit": get_tools_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": []
+    }
+
+    for records in [int(i) for i in args.records.split(",")]:
+        if args.work_dir is not None:
+            work_dir = os.path.join(args.work_dir, str(records))
+            os.makedirs(work_dir)
+            report["results"].extend(Benchmark(records, work_dir, args.workers).run())
+        else:
+            with tempfile.TemporaryDirectory() as work_dir:
+                report["results"].extend(Benchmark(records, work_dir, args.workers).run())
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as fh:
+            fh.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
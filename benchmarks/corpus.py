@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import random
+import datetime
+import subprocess
+
+# Builds a fake cvedb-database that looks like the real one, laid out as
+# YYYY/NNNNxxx/CVEDB-YYYY-NNNNNNN.json with CVEDB, OSV and namespaces
+# objects, so the bot and the analysis can be timed without cloning
+# anything. The same size and seed always give the same database.
+#
+# Usage: corpus.py <directory> [records] [seed]
+
+words = ["buffer", "overflow", "remote", "attacker", "crafted", "request", "allows", "denial", "service",
+         "memory", "corruption", "kernel", "driver", "authentication", "bypass", "injection", "parameter",
+         "privilege", "escalation", "information", "disclosure", "heap", "use-after-free", "null", "pointer"]
+
+vendors = [("Linux", "Kernel"), ("Apache", "HTTP Server"), ("OpenSSL", "OpenSSL"), ("Python", "CPython"),
+           ("Mozilla", "Firefox"), ("Microsoft", "Windows"), ("Google", "Chrome"), ("Oracle", "MySQL")]
+
+vuln_types = ["Buffer overflow", "Use after free", "SQL injection", "Cross site scripting", "Path traversal"]
+
+def get_text(rng, count):
+    return " ".join(rng.choice(words) for i in range(count))
+
+def get_entry(rng, the_id, year):
+    cve_id = "CVE-%s-%d" % (year, rng.randint(1000, 99999))
+    (vendor, product) = rng.choice(vendors)
+    description = get_text(rng, rng.randint(20, 60))
+    the_time = "%s-%02d-%02dT%02d:%02d:00Z" % (year, rng.randint(1, 12), rng.randint(1, 28),
+                                               rng.randint(0, 23), rng.randint(0, 59))
+
+    the_data = {
+        # The fields the bot copies from the issue form
+        "CVEDB": {
+            "alias": cve_id,
+            "description": description,
+            "vendor_name": vendor,
+            "product_name": product,
+            "product_version": "%d.%d" % (rng.randint(0, 9), rng.randint(0, 20)),
+            "vulnerability_type": rng.choice(vuln_types),
+            "impact": rng.choice(["unspecified", "code execution", "denial of service"]),
+            "references": ["https://example.com/advisory/%s" % the_id]
+        },
+        "OSV": {
+            "id": the_id,
+            "aliases": [cve_id],
+            "summary": get_text(rng, 8),
+            "details": description,
+            "modified": the_time,
+            "published": the_time,
+            "affected": [{"package": {"ecosystem": vendor, "name": product}}],
+            "references": [{"type": "WEB", "url": "https://example.com/advisory/%s" % the_id}]
+        },
+        "namespaces": {
+            "cve.org": {
+                "CVE_data_meta": {"ASSIGNER": "cve@mitre.org", "ID": cve_id, "STATE": "PUBLIC"},
+                "description": {"description_data": [{"lang": "eng", "value": description}]}
+            }
+        }
+    }
+
+    # Most of the IDs have NVD data, a few have the other namespaces
+    if rng.random() < 0.9:
+        the_data["namespaces"]["nvd.nist.gov"] = {
+            "cve": {"CVE_data_meta": {"ASSIGNER": "cve@mitre.org", "ID": cve_id}},
+            "impact": {"baseMetricV3": {"cvssV3": {"baseScore": round(rng.uniform(1, 10), 1)}}},
+            "lastModifiedDate": the_time,
+            "publishedDate": the_time
+        }
+    if rng.random() < 0.02:
+        the_data["namespaces"]["cisa.gov"] = {"cveID": cve_id, "vendorProject": vendor, "product": product}
+    if rng.random() < 0.1:
+        the_data["namespaces"]["gitlab.com"] = {"advisories": [{"identifier": cve_id, "title": get_text(rng, 6)}]}
+
+    return the_data
+
+def get_ids(records, years):
+    # Spread the records over the years, numbered from 1000000 like the bot does
+    per_year = int(records / len(years))
+    for (i, year) in enumerate(years):
+        count = per_year
+        if i == len(years) - 1:
+            count = records - per_year * (len(years) - 1)
+        for id_num in range(1000000, 1000000 + count):
+            yield (year, id_num)
+
+def generate(repo_dir, records, seed=0, years=None, commit=True):
+    # Returns the number of IDs written
+    rng = random.Random(seed)
+    if years is None:
+        this_year = datetime.datetime.now().year
+        years = [str(i) for i in range(this_year - 3, this_year + 1)]
+
+    os.makedirs(repo_dir, exist_ok=True)
+    with open(os.path.join(repo_dir, "allowlist.json"), "w") as fh:
+        fh.write(json.dumps(["joshbressers:1692786"]))
+    with open(os.path.join(repo_dir, "nvd_updated_time.txt"), "w") as fh:
+        fh.write("%s:00\n" % datetime.datetime(int(years[-1]), 1, 1).isoformat())
+
+    count = 0
+    block_dir = None
+    for (year, id_num) in get_ids(records, years):
+        the_id = "CVEDB-%s-%d" % (year, id_num)
+        if id_num % 1000 == 0 or block_dir is None:
+            block_dir = os.path.join(repo_dir, year, "%dxxx" % int(id_num / 1000))
+            os.makedirs(block_dir, exist_ok=True)
+        with open(os.path.join(block_dir, the_id + ".json"), "w") as fh:
+            fh.write(json.dumps(get_entry(rng, the_id, year), indent=2) + "\n")
+        count = count + 1
+
+    if commit:
+        git = ["git", "-C", repo_dir, "-c", "user.name=Benchmark", "-c", "user.email=benchmark@example.com"]
+        subprocess.run(git + ["init", "-q", "-b", "main"], check=True)
+        subprocess.run(git + ["add", "-A"], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "Synthetic database, %d IDs" % count], check=True)
+
+    return count
+
+if __name__ == "__main__":
+    records = 10000
+    seed = 0
+    if len(sys.argv) > 2:
+        records = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        seed = int(sys.argv[3])
+    print("Wrote %d IDs" % generate(sys.argv[1], records, seed))
@@ -0,0 +1,151 @@
+import os
+import json
+
+class IDAllocator:
+    # Hands out the next free ID for a year without listing every block
+    # directory. We keep the highest ID we know about in each block in a
+    # small index file that lives in the .git directory so it's never
+    # committed and survives a reset of the working copy.
+    #
+    # The index is tied to the commit it was built from. If HEAD moves
+    # under us (someone else pushed) or an ID we handed out never made it
+    # into a commit, the year gets rebuilt from the tree.
+
+    def __init__(self, repo_dir, index_file):
+        self.repo_dir = repo_dir
+        self.index_file = index_file
+        self.head = None
+        self.years = {}
+        self.pending = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_file):
+            return
+
+        try:
+            with open(self.index_file) as fh:
+                index = json.load(fh)
+        except ValueError:
+            # A broken index is the same as no index
+            return
+
+        self.head = index["head"]
+        self.years = index["years"]
+        self.pending = index["pending"]
+
+        # IDs we handed out but that were thrown away before they were
+        # committed mean the index is ahead of the tree
+        for i in self.pending:
+            if not os.path.exists(self.get_path(i)):
+                self.years = {}
+                self.pending = []
+                break
+
+    def save(self):
+        index = {
+            "head": self.head,
+            "years": self.years,
+            "pending": self.pending
+        }
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, 'w') as fh:
+            fh.write(json.dumps(index))
+        os.replace(tmp_file, self.index_file)
+
+    def check_head(self, head):
+        # Call this whenever the working copy might have changed, anything
+        # we knew about an older commit is stale
+        if head != self.head:
+            self.head = head
+            self.years = {}
+            self.pending = []
+            self.save()
+
+    def discard_pending(self):
+        # The working copy was reset, so the IDs we handed out but never
+        # committed are gone and their numbers are free again
+        if len(self.pending) > 0:
+            self.years = {}
+            self.pending = []
+            self.save()
+
+    def release(self, cvedb_id):
+        # An ID we handed out won't be used after all. Its file is gone,
+        # so forget the year and the next allocation finds the gap
+        if cvedb_id in self.pending:
+            self.pending.remove(cvedb_id)
+        self.years.pop(cvedb_id.split('-')[1], None)
+        self.save()
+
+    def set_head(self, head):
+        # We just committed everything we handed out, the index is good
+        # for the new HEAD as it stands
+        self.head = head
+        self.pending = []
+        self.save()
+
+    def get_path(self, cvedb_id):
+        (year, id_only) = cvedb_id.split('-')[1:3]
+        block_path = "%dxxx" % int(int(id_only)/1000)
+        return os.path.join(self.repo_dir, year, block_path, cvedb_id + ".json")
+
+    def rebuild_year(self, year):
+        # Scan the year once to find the highest ID in each block
+        blocks = {}
+        year_dir = os.path.join(self.repo_dir, year)
+        if os.path.exists(year_dir):
+            for i in os.listdir(year_dir):
+                if not i.endswith("xxx"):
+                    continue
+                block_num = int(i[0:-3])
+                if block_num < 1000 or block_num > 1999:
+                    continue
+                ids = [int(f.split('.')[0].split('-')[2]) for f in os.listdir(os.path.join(year_dir, i))
+                        if f.endswith(".json")]
+                if len(ids) > 0:
+                    blocks[str(block_num)] = max(ids)
+
+        self.years[year] = {
+            "blocks": blocks,
+            "next": self.find_next(blocks, 1000000)
+        }
+
+    def find_next(self, blocks, next_id):
+        # Start looking in block 1000xxx, if that's full move to 1001xxx
+        # We will consider our namespace everything up to 1999999
+        while True:
+            block = str(int(next_id/1000))
+            if block not in blocks:
+                return next_id
+            if blocks[block] % 1000 == 999:
+                # It's time to roll over
+                next_id = (int(block) + 1) * 1000
+                continue
+            if blocks[block] >= next_id:
+                next_id = blocks[block] + 1
+                continue
+            return next_id
+
+    def allocate(self, year, count=1):
+        # Returns a list of the next count ID numbers for the year
+        if year not in self.years:
+            self.rebuild_year(year)
+
+        # Somebody wrote an ID we didn't know about
+        if os.path.exists(self.get_path("CVEDB-%s-%s" % (year, self.years[year]["next"]))):
+            self.rebuild_year(year)
+
+        the_year = self.years[year]
+        ids = []
+        for i in range(count):
+            next_id = the_year["next"]
+            if next_id > 1999999:
+                raise Exception("Out of IDs for %s" % year)
+            ids.append(next_id)
+            the_year["blocks"][str(int(next_id/1000))] = next_id
+            the_year["next"] = self.find_next(the_year["blocks"], next_id + 1)
+            self.pending.append("CVEDB-%s-%s" % (year, next_id))
+
+        self.save()
+        return ids
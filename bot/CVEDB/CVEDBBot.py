@@ -0,0 +1,280 @@
+import re
+import time
+import json
+import hmac
+import hashlib
+import threading
+import traceback
+import http.server
+import concurrent.futures
+from .CVEDBRepo import CVEDBRepo
+from .CVEDBGithub import get_new_issues, get_approved_can_issues, get_issues_graphql
+from .CVEDBIssue import Issue
+
+def prefetch_can(i):
+    # Find the approver and the CAN ID while the other issues do the same
+    i.who_approved()
+    i.get_cvedb_id()
+
+def assign_issue(assignment):
+    (i, cvedb_id, approved) = assignment
+    i.assign_cvedb(cvedb_id, approved)
+
+class Bot:
+    # One pass over the open issues is a cycle. The repo checkout is kept
+    # between cycles so a long running bot only has to fetch what changed.
+
+    def __init__(self, repo_name, repo_dir=None, shallow=False, sparse=False, graphql=False,
+                 commit_size=0, workers=4, session=None, api_url="https://api.github.com",
+                 repo_url=None):
+        self.repo_name = repo_name
+        self.api_url = api_url
+        self.issues_url = "%s/repos/%s/issues" % (api_url, repo_name)
+        self.repo_url = repo_url
+        if self.repo_url is None:
+            self.repo_url = "https://github.com/%s.git" % repo_name
+        self.repo_dir = repo_dir
+        self.shallow = shallow
+        self.sparse = sparse
+        self.graphql = graphql
+        self.commit_size = commit_size
+        self.workers = workers
+        self.session = session
+        self.repo = None
+
+        # How long the last cycle spent on each step, and totals since we
+        # started
+        self.timings = {}
+        self.counters = {
+            "cycles": 0,
+            "busy_cycles": 0,
+            "failed_cycles": 0,
+            "failed_issues": 0,
+            "assigned": 0,
+            "promoted": 0,
+            "seconds": 0.0
+        }
+
+    def run_parallel(self, func, items):
+        # The GitHub calls for different issues don't depend on each other.
+        # If any of them fail we still wait for the rest, then raise. map()
+        # would cancel the ones that hadn't started yet
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(func, i) for i in items]
+        return [i.result() for i in futures]
+
+    def issue_failed(self, issue, error):
+        # The repo took back whatever the issue changed, the rest of the
+        # batch still goes out and this one gets tried again next cycle
+        print("Skipping issue %s: %s" % (issue.id, error))
+        traceback.print_exc()
+        self.counters["failed_issues"] = self.counters["failed_issues"] + 1
+
+    def get_issues(self):
+        if self.graphql:
+            new_issues = get_issues_graphql(self.repo_name, ['new', 'check'], self.session,
+                                            api_url=self.api_url)
+            can_issues = get_issues_graphql(self.repo_name, ['approved'], self.session,
+                                            api_url=self.api_url)
+        else:
+            new_issues = get_new_issues(self.issues_url, self.session)
+            can_issues = get_approved_can_issues(self.issues_url, self.session)
+        return (new_issues, can_issues)
+
+    def get_repo(self):
+        if self.repo is None:
+            self.repo = CVEDBRepo(self.repo_url, repo_dir=self.repo_dir,
+                                  shallow=self.shallow, sparse=self.sparse)
+        else:
+            self.repo.refresh()
+        return self.repo
+
+    def run_cycle(self):
+        # Returns how many issues we did something with
+        timings = {}
+        start_time = time.monotonic()
+
+        (new_issues, can_issues) = self.get_issues()
+        timings["fetch"] = time.monotonic() - start_time
+
+        assigned = []
+        promoted = []
+
+        if len(new_issues) > 0 or len(can_issues) > 0:
+
+            # Only touch the repo if we have work to do
+            step_time = time.monotonic()
+            cvedb_repo = self.get_repo()
+            timings["repo"] = time.monotonic() - step_time
+
+            step_time = time.monotonic()
+            self.run_parallel(prefetch_can, can_issues)
+            timings["prefetch"] = time.monotonic() - step_time
+
+            # All the repo changes get pushed in one go, we only touch the
+            # issues once that worked. The IDs are handed out one issue at a
+            # time in the order GitHub gave us the issues. An issue that
+            # fails is left out of the batch instead of sinking it
+            step_time = time.monotonic()
+            cvedb_repo.start_batch(self.commit_size)
+            try:
+
+                # Look for new issues
+                for i in new_issues:
+
+                    if re.search(r'(CVEDB|CAN)-\d{4}-\d+', i.title):
+                        # There shouldn't be a CVEDB/CAN ID in the title, bail on this issue
+                        print("Found an ID in the title for issue %s" % i.id)
+                        continue
+
+                    if not cvedb_repo.approved_user(user_name=i.creator, user_id=i.creator_id):
+                        print("Issue %s is not created by an approved user" % (i.id))
+                        continue
+
+                    print("Updating issue %s" % i.id)
+                    try:
+                        cvedb_id = cvedb_repo.add_cvedb(i)
+                    except Exception as e:
+                        self.issue_failed(i, e)
+                        continue
+                    assigned.append((i, cvedb_id, cvedb_repo.approved_user(i.get_reporter())))
+
+                # Now look for approved CAN issues
+                for i in can_issues:
+                    approver = i.who_approved()
+                    if cvedb_repo.approved_user(approver):
+                        # Flip this to a CVEDB
+                        try:
+                            cvedb_repo.can_to_cvedb(i)
+                        except Exception as e:
+                            self.issue_failed(i, e)
+                            continue
+                        promoted.append(i)
+                    else:
+                        print("%s is unapproved for %s" % (approver, i.id))
+
+            finally:
+                cvedb_repo.finish_batch()
+            timings["commit"] = time.monotonic() - step_time
+
+            step_time = time.monotonic()
+            self.run_parallel(assign_issue, assigned)
+            self.run_parallel(Issue.can_to_cvedb, promoted)
+            timings["github"] = time.monotonic() - step_time
+
+        timings["total"] = time.monotonic() - start_time
+        self.timings = timings
+
+        self.counters["cycles"] = self.counters["cycles"] + 1
+        self.counters["assigned"] = self.counters["assigned"] + len(assigned)
+        self.counters["promoted"] = self.counters["promoted"] + len(promoted)
+        self.counters["seconds"] = self.counters["seconds"] + timings["total"]
+        if len(assigned) > 0 or len(promoted) > 0:
+            self.counters["busy_cycles"] = self.counters["busy_cycles"] + 1
+            print("Cycle took %s" % ", ".join(["%s %.2fs" % (k, timings[k]) for k in timings]))
+
+        return len(assigned) + len(promoted)
+
+    def close(self):
+        if self.repo is not None:
+            self.repo.close()
+            self.repo = None
+
+class Daemon:
+    # Keeps the bot running instead of starting it again for every cycle.
+    # We poll quickly while there's work and back off while it's quiet. A
+    # POST to the optional webhook wakes us up right away, a GET returns
+    # the bot's timings and counters and the last error.
+
+    def __init__(self, bot, min_interval=10, max_interval=300, webhook_port=None,
+                 webhook_host="127.0.0.1", webhook_secret=None):
+        self.bot = bot
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.webhook_secret = webhook_secret
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.server = None
+        self.last_error = None
+
+        if webhook_port is not None:
+            self.server = http.server.ThreadingHTTPServer((webhook_host, webhook_port), self.get_handler())
+            self.webhook_port = self.server.server_address[1]
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def get_handler(self):
+        daemon = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def send_json(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.send_json(200, {
+                    "interval": daemon.interval,
+                    "timings": daemon.bot.timings,
+                    "counters": daemon.bot.counters,
+                    "last_error": daemon.last_error
+                })
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = self.rfile.read(length)
+                if not daemon.check_signature(payload, self.headers.get("X-Hub-Signature-256")):
+                    self.send_json(403, {"message": "Bad signature"})
+                    return
+                daemon.wakeup.set()
+                self.send_json(202, {"message": "Queued"})
+
+        return Handler
+
+    def check_signature(self, payload, signature):
+        # GitHub signs webhook payloads with the shared secret
+        if self.webhook_secret is None:
+            return True
+        if signature is None:
+            return False
+        expected = "sha256=" + hmac.new(self.webhook_secret.encode(), payload, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def next_interval(self, work_done):
+        if work_done > 0:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
+
+    def run_once(self):
+        try:
+            work_done = self.bot.run_cycle()
+        except Exception as e:
+            # Don't let one bad cycle kill the bot, throw away the checkout
+            # in case it's in a strange state and try again later
+            print("Cycle failed: %s" % e)
+            traceback.print_exc()
+            self.bot.counters["failed_cycles"] = self.bot.counters["failed_cycles"] + 1
+            self.last_error = "%s: %s" % (type(e).__name__, e)
+            self.bot.close()
+            work_done = 0
+        return self.next_interval(work_done)
+
+    def run(self):
+        while not self.stopped.is_set():
+            interval = self.run_once()
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.bot.close()
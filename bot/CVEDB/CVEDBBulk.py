@@ -0,0 +1,224 @@
+import os
+import re
+import git
+import json
+import tempfile
+import multiprocessing
+from .CVEDBManifest import scan_ids
+
+# Rewriting every ID in the database one get_id()/update_id() at a time
+# takes hours. This walks the tree once, runs the transform over the files
+# in a pool of processes, only writes the files that really changed and
+# stages them all with one index update.
+
+def get_indent(raw_data):
+    # The bot writes with 2 spaces, things that came from the CVE side use
+    # 4, keep whatever the file already has so we don't rewrite it for nothing
+    lines = raw_data.split(b"\n", 2)
+    if len(lines) < 2 or len(lines[1].strip()) == 0:
+        return None
+    return len(lines[1]) - len(lines[1].lstrip(b" "))
+
+def update_index(repo, paths):
+    # Stages the paths with a single git update-index. index.add() hashes
+    # every file through its own round trip to git, which is most of the
+    # time a big rewrite takes. --remove drops paths that are gone from
+    # the working tree
+    with tempfile.TemporaryFile(dir=repo.git_dir) as fh:
+        fh.write(("\0".join(paths) + "\0").encode())
+        fh.seek(0)
+        repo.git.update_index("--add", "--remove", "-z", "--stdin", istream=fh)
+
+the_transform = None
+the_dry_run = False
+
+def init_worker(transform, dry_run):
+    global the_transform
+    global the_dry_run
+    the_transform = transform
+    the_dry_run = dry_run
+
+def rewrite_id(the_id_path):
+    # Returns (id, path, changed)
+    (the_id, path) = the_id_path
+    with open(path, 'rb') as fh:
+        raw_data = fh.read()
+
+    new_data = the_transform(the_id, json.loads(raw_data))
+    if new_data is None:
+        return (the_id, path, False)
+
+    new_raw_data = (json.dumps(new_data, indent=get_indent(raw_data)) + "\n").encode()
+    if new_raw_data == raw_data:
+        return (the_id, path, False)
+
+    if not the_dry_run:
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'wb') as fh:
+            fh.write(new_raw_data)
+        os.replace(tmp_file, path)
+    return (the_id, path, True)
+
+class BulkRewrite:
+    # transform(the_id, the_data) returns the new data, or None to leave
+    # the file alone. It runs in other processes, so it has to be a module
+    # level function and anything it changes outside the data is lost.
+
+    def __init__(self, cvedb_repo, transform, workers=None, dry_run=False, chunksize=64):
+        self.cvedb_repo = cvedb_repo
+        self.transform = transform
+        self.workers = workers
+        self.dry_run = dry_run
+        self.chunksize = chunksize
+        self.changed = []
+        self.stats = {
+            "scanned": 0,
+            "changed": 0
+        }
+
+    def run(self, ids=None, years=None, blocks=None):
+        if ids is None:
+            ids = scan_ids(self.cvedb_repo.repo_dir, years, blocks)
+        else:
+            ids = [(i, self.cvedb_repo.get_file(i)) for i in ids]
+
+        # fork so the transform and anything it uses from the script
+        # comes along without being imported again
+        context = multiprocessing.get_context("fork")
+        with context.Pool(self.workers, initializer=init_worker,
+                          initargs=(self.transform, self.dry_run)) as pool:
+            for (the_id, path, changed) in pool.imap_unordered(rewrite_id, ids, self.chunksize):
+                self.stats["scanned"] = self.stats["scanned"] + 1
+                if changed:
+                    self.stats["changed"] = self.stats["changed"] + 1
+                    self.changed.append(path)
+
+        if not self.dry_run and len(self.changed) > 0:
+            self.changed.sort()
+            repo_dir = self.cvedb_repo.repo_dir
+            update_index(self.cvedb_repo.repo, [os.path.relpath(i, repo_dir) for i in self.changed])
+
+        return self.stats
+
+class BulkRename:
+    # Moves every ID from one prefix to another, UVI-2021-1000000.json to
+    # CVEDB-2021-1000000.json for example. transform(old_id, new_id, the_data)
+    # returns the data to write to the new file.
+    #
+    # Every rename is written to a journal in .git before we touch the
+    # files, so if we get interrupted running it again finishes the job.
+    # The index is only updated once, at the end, with a single git call.
+
+    def __init__(self, repo_dir, old_prefix, new_prefix, transform=None, batch_size=1000):
+        self.repo_dir = repo_dir
+        self.repo = git.Repo(repo_dir)
+        self.old_prefix = old_prefix + "-"
+        self.new_prefix = new_prefix + "-"
+        self.transform = transform
+        self.batch_size = batch_size
+        self.journal_file = os.path.join(self.repo.git_dir, "cvedb-rename.journal")
+        self.stats = {
+            "renamed": 0,
+            "resumed": 0,
+            "staged": 0
+        }
+
+    def get_new_id(self, the_id):
+        return self.new_prefix + the_id[len(self.old_prefix):]
+
+    def load_journal(self):
+        # Returns the renames a run that didn't finish already started
+        if not os.path.exists(self.journal_file):
+            return []
+        with open(self.journal_file, 'rb') as fh:
+            data = fh.read()
+
+        # Every record ends with a newline, a last line without one was cut
+        # off and we never got to that batch. It gets cut from the file too
+        # so the records we append start on a line of their own
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            os.truncate(self.journal_file, end)
+
+        records = [i.split("\t") for i in data[:end].decode().split("\n")[:-1]]
+        return [i for i in records if self.check_record(i)]
+
+    def check_record(self, record):
+        # Only trust a record if the new path is the one we'd make from the
+        # old path
+        if len(record) != 2:
+            return False
+        (old_path, new_path) = record
+        (old_id, ext) = os.path.splitext(os.path.basename(old_path))
+        if ext != ".json" or not re.fullmatch(re.escape(self.old_prefix) + r"\d{4}-\d+", old_id):
+            return False
+        return new_path == os.path.join(os.path.dirname(old_path), self.get_new_id(old_id) + ".json")
+
+    def write_journal(self, fh, batch):
+        for (old_path, new_path) in batch:
+            fh.write("%s\t%s\n" % (old_path, new_path))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    def rename_id(self, the_id, old_file, new_file):
+        with open(old_file, 'rb') as fh:
+            raw_data = fh.read()
+
+        the_data = json.loads(raw_data)
+        if self.transform is not None:
+            the_data = self.transform(the_id, self.get_new_id(the_id), the_data)
+
+        # Write the new file first, if we die before the old one is gone
+        # the next run does this one again
+        tmp_file = new_file + ".tmp"
+        with open(tmp_file, 'wb') as fh:
+            fh.write((json.dumps(the_data, indent=get_indent(raw_data)) + "\n").encode())
+        os.replace(tmp_file, new_file)
+        os.remove(old_file)
+
+    def rename_batch(self, journal, batch):
+        self.write_journal(journal, [(i[1], i[2]) for i in batch])
+        for (the_id, old_file, new_file) in batch:
+            self.rename_id(the_id, os.path.join(self.repo_dir, old_file),
+                           os.path.join(self.repo_dir, new_file))
+        self.stats["renamed"] = self.stats["renamed"] + len(batch)
+
+    def stage(self, renames):
+        # The old paths are gone from the working tree so they get dropped,
+        # the new ones get added. Paths that were already staged by an
+        # earlier run don't hurt.
+        paths = []
+        for (old_path, new_path) in renames.items():
+            paths.append(old_path)
+            paths.append(new_path)
+
+        update_index(self.repo, paths)
+        self.stats["staged"] = len(renames)
+
+    def run(self):
+        # old path -> new path, a batch that got cut off shows up again
+        renames = dict(self.load_journal())
+        self.stats["resumed"] = len(renames)
+
+        with open(self.journal_file, 'a') as journal:
+            batch = []
+            for (the_id, path) in scan_ids(self.repo_dir):
+                if not the_id.startswith(self.old_prefix):
+                    continue
+                old_file = os.path.relpath(path, self.repo_dir)
+                new_file = os.path.join(os.path.dirname(old_file), self.get_new_id(the_id) + ".json")
+                batch.append((the_id, old_file, new_file))
+                if len(batch) >= self.batch_size:
+                    self.rename_batch(journal, batch)
+                    renames.update([(i[1], i[2]) for i in batch])
+                    batch = []
+
+            if len(batch) > 0:
+                self.rename_batch(journal, batch)
+                renames.update([(i[1], i[2]) for i in batch])
+
+        if len(renames) > 0:
+            self.stage(renames)
+        os.remove(self.journal_file)
+
+        return self.stats
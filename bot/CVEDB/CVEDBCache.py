@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import threading
+
+class CachedResponse:
+    # Looks enough like a requests response for the rest of the bot
+    def __init__(self, entry):
+        self.status_code = 200
+        self.from_cache = True
+        self.url = entry["url"]
+        self.headers = entry["headers"]
+        self.body = entry["body"]
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+class ResponseCache:
+    # An on disk cache of GitHub API responses. GithubSession sends the
+    # ETag and Last-Modified we saw last time, GitHub answers with a 304 if
+    # nothing changed and those don't count against the rate limit.
+    #
+    # Every URL and page gets its own file, once the cache is bigger than
+    # max_size the least recently used files are thrown away.
+
+    def __init__(self, cache_dir, max_size=64*1024*1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.size = 0
+        for i in os.scandir(self.cache_dir):
+            if i.name.endswith(".json"):
+                self.size = self.size + i.stat().st_size
+
+    def get_file(self, url, params):
+        key = url
+        if params is not None:
+            key = key + "?" + "&".join(["%s=%s" % (k, params[k]) for k in sorted(params)])
+        the_hash = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, the_hash + ".json")
+
+    def load(self, cache_file):
+        try:
+            with open(cache_file) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, cache_file, resp):
+        # Only keep the headers we need to use the response again
+        headers = {}
+        for i in ["ETag", "Last-Modified", "Link"]:
+            if i in resp.headers:
+                headers[i] = resp.headers[i]
+
+        entry = {
+            "url": resp.url,
+            "headers": headers,
+            "body": resp.json()
+        }
+
+        # Pages can be fetched from several threads at once
+        with self.lock:
+            old_size = 0
+            if os.path.exists(cache_file):
+                old_size = os.path.getsize(cache_file)
+
+            tmp_file = cache_file + ".tmp"
+            with open(tmp_file, 'w') as fh:
+                fh.write(json.dumps(entry))
+            os.replace(tmp_file, cache_file)
+
+            self.size = self.size + os.path.getsize(cache_file) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        # Throw away the least recently used entries until we fit again
+        entries = []
+        for i in os.scandir(self.cache_dir):
+            if i.name.endswith(".json"):
+                stat = i.stat()
+                entries.append((stat.st_mtime, stat.st_size, i.path))
+        entries.sort()
+
+        self.size = sum([i[1] for i in entries])
+        target = self.max_size * 0.8
+        for (mtime, size, path) in entries:
+            if self.size <= target:
+                break
+            os.remove(path)
+            self.size = self.size - size
+
+    def touch(self, cache_file):
+        # Touch the file so it counts as recently used
+        os.utime(cache_file)
+
+the_cache = None
+
+def get_cache():
+    # The cache is only used if CVEDB_CACHE_DIR is set
+    global the_cache
+    if the_cache is None and os.environ.get('CVEDB_CACHE_DIR'):
+        max_size = int(os.environ.get('CVEDB_CACHE_SIZE', 64*1024*1024))
+        the_cache = ResponseCache(os.environ['CVEDB_CACHE_DIR'], max_size)
+    return the_cache
@@ -1,10 +1,9 @@
-
-import requests
-import os
 from .CVEDBIssue import Issue
+from .CVEDBSession import get_session
 
-def get_new_issues(issues_url):
-    auth = (os.environ['GH_USERNAME'], os.environ['GH_TOKEN'])
+def get_new_issues(issues_url, session=None):
+    if session is None:
+        session = get_session()
     params = {
             'accept': "application/vnd.github.v3+json",
             'labels': 'new,check',
@@ -12,19 +11,20 @@ def get_new_issues(issues_url):
     }
 
     # XXX Get the repo from the environment or something
-    resp = requests.get(issues_url, auth=auth, params=params)
+    resp = session.get(issues_url, params=params)
     resp.raise_for_status()
 
     issues = resp.json()
 
     to_return = []
     for i in issues:
-        to_return.append(Issue(i))
+        to_return.append(Issue(i, session))
 
     return to_return
 
-def get_approved_can_issues(issues_url):
-    auth = (os.environ['GH_USERNAME'], os.environ['GH_TOKEN'])
+def get_approved_can_issues(issues_url, session=None):
+    if session is None:
+        session = get_session()
     params = {
             'accept': "application/vnd.github.v3+json",
             'labels': 'approved',
@@ -32,13 +32,145 @@ def get_approved_can_issues(issues_url):
     }
 
     # XXX Get the repo from the environment or something
-    resp = requests.get(issues_url, auth=auth, params=params)
+    resp = session.get(issues_url, params=params)
     resp.raise_for_status()
 
     issues = resp.json()
 
     to_return = []
     for i in issues:
-        to_return.append(Issue(i))
+        to_return.append(Issue(i, session))
+
+    return to_return
+
+# Pulls the open issues with their labels, last comments and label events
+# in one go. GitHub ORs the labels in a GraphQL filter, so we only filter on
+# the first one and check the rest ourselves.
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $label: String!, $cursor: String, $comments: Int!) {
+  repository(owner: $owner, name: $name) {
+    issues(first: 50, after: $cursor, states: OPEN, labels: [$label]) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        number
+        title
+        body
+        url
+        author {
+          login
+          ... on User { databaseId }
+          ... on Bot { databaseId }
+        }
+        labels(first: 20) {
+          nodes { name }
+        }
+        comments(last: $comments) {
+          totalCount
+          nodes {
+            body
+            author { login }
+          }
+        }
+        timelineItems(last: 100, itemTypes: [LABELED_EVENT]) {
+          totalCount
+          nodes {
+            ... on LabeledEvent {
+              label { name }
+              actor {
+                login
+                ... on User { databaseId }
+                ... on Bot { databaseId }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+def graphql_to_issue(repo_name, node, session, api_url):
+    # Make the GraphQL issue look like what the REST API would give us
+    url = "%s/repos/%s/issues/%d" % (api_url, repo_name, node['number'])
+    # Issues opened by deleted users don't have an author
+    author = node['author'] or {'login': None}
+    details = {
+        'number': node['number'],
+        'title': node['title'],
+        'body': node['body'],
+        'url': url,
+        'html_url': node['url'],
+        'comments_url': url + "/comments",
+        'events_url': url + "/events",
+        'user': {
+            'login': author['login'],
+            'id': author.get('databaseId')
+        }
+    }
+
+    # If we only got some of the comments or events, the Issue goes and
+    # gets all of them from the REST API if it needs them
+    comments = None
+    if node['comments']['totalCount'] <= len(node['comments']['nodes']):
+        comments = []
+        for i in node['comments']['nodes']:
+            login = None
+            if i['author'] is not None:
+                login = i['author']['login']
+            comments.append({'user': {'login': login}, 'body': i['body']})
+
+    events = None
+    if node['timelineItems']['totalCount'] <= len(node['timelineItems']['nodes']):
+        events = []
+        for i in node['timelineItems']['nodes']:
+            actor = i['actor'] or {'login': None}
+            events.append({
+                'event': 'labeled',
+                'label': {'name': i['label']['name']},
+                'actor': {'login': actor['login'], 'id': actor.get('databaseId')}
+            })
+
+    return Issue(details, session, comments=comments, events=events)
+
+def get_issues_graphql(repo_name, labels, session=None, comments=20,
+                       api_url="https://api.github.com"):
+    # Returns the open issues in repo_name that have all of labels
+    if session is None:
+        session = get_session()
+    (owner, name) = repo_name.split('/')
+
+    to_return = []
+    cursor = None
+    while True:
+        body = {
+            'query': ISSUES_QUERY,
+            'variables': {
+                'owner': owner,
+                'name': name,
+                'label': labels[0],
+                'cursor': cursor,
+                'comments': comments
+            }
+        }
+        # A query only reads, so it's safe to send again
+        resp = session.post("%s/graphql" % api_url, json=body, idempotent=True)
+        resp.raise_for_status()
+        data = resp.json()
+        if 'errors' in data:
+            raise Exception("GraphQL query failed: %s" % data['errors'])
+
+        issues = data['data']['repository']['issues']
+        for i in issues['nodes']:
+            issue_labels = [l['name'] for l in i['labels']['nodes']]
+            if all([l in issue_labels for l in labels]):
+                to_return.append(graphql_to_issue(repo_name, i, session, api_url))
+
+        if not issues['pageInfo']['hasNextPage']:
+            break
+        cursor = issues['pageInfo']['endCursor']
 
     return to_return
@@ -3,9 +3,58 @@ import requests
 import os
 import json
 import re
+import urllib.parse
+import concurrent.futures
+from .CVEDBSession import get_session
+
+def get_links(resp):
+    # Turns the Link header into a dict of rel -> url
+    links = {}
+    for i in requests.utils.parse_header_links(resp.headers.get('Link', '')):
+        if 'rel' in i:
+            links[i['rel']] = i['url']
+    return links
+
+def get_pages(session, url, per_page=100, workers=4):
+    # Returns every item of a paginated GitHub API list. The first page
+    # tells us where the last one is, the rest are fetched in parallel
+    params = {
+            'per_page': per_page,
+            'page': 1
+    }
+    resp = session.get(url, params=params)
+    resp.raise_for_status()
+    items = list(resp.json())
+    links = get_links(resp)
+
+    if 'last' in links:
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(links['last']).query)
+        last_page = int(query['page'][0])
+
+        def get_page(page):
+            page_params = {
+                    'per_page': per_page,
+                    'page': page
+            }
+            page_resp = session.get(url, params=page_params)
+            page_resp.raise_for_status()
+            return page_resp.json()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for i in pool.map(get_page, range(2, last_page + 1)):
+                items.extend(i)
+    else:
+        # No last link, just follow next until we run out
+        while 'next' in links:
+            resp = session.get(links['next'])
+            resp.raise_for_status()
+            items.extend(resp.json())
+            links = get_links(resp)
+
+    return items
 
 class Issue:
-    def __init__(self, details):
+    def __init__(self, details, session=None, comments=None, events=None):
 
         self.raw_data = details
         self.lines = details['body'].splitlines()
@@ -17,16 +66,40 @@ class Issue:
         self.id = details['number'];    
         self.creator = details['user']['login']
         self.creator_id = details['user']['id']
-        self.auth = (os.environ['GH_USERNAME'], os.environ['GH_TOKEN'])
+        self.session = session
+        if self.session is None:
+            self.session = get_session()
+
+        # The GraphQL fetcher hands us the comments and events up front so
+        # we don't have to ask for them again
+        self.comments = comments
+        self.events = events
+
+        # Things we worked out from the body, comments and events. The bot
+        # asks for these a few times per issue so we only do the work once
+        self.cvedb_data = None
+        self.cached = {}
+
+    def invalidate(self):
+        # We just changed the issue, forget anything that came from the
+        # comments and events
+        self.comments = None
+        self.events = None
+        self.cached = {}
 
     def get_cvedb_id(self):
+        if 'cvedb_id' not in self.cached:
+            self.cached['cvedb_id'] = self.find_cvedb_id()
+        return self.cached['cvedb_id']
+
+    def find_cvedb_id(self):
         # We are going to only trust the comment from <username> for this
         # ID. It's the most trustworthy ID
 
         comments = self.get_comments()
         comments.reverse()
         for i in comments:
-            if i['user']['login'] == os.environ['GH_USERNAME']:
+            if i['user']['login'] == self.session.username:
                 if i['body'].startswith('This issue has been assigned'):
                     match = re.search('((CVEDB|CAN)-\d{4}-\d+)', i['body'])
                     cvedb_id = match.groups()[0]
@@ -34,43 +107,21 @@ class Issue:
         return None
 
     def get_events(self):
-
-        events = []
-        page = 0
-        while(True):
-            params = {
-                    'per_page': 100,
-                    'page': page
-            }
-            resp = requests.get(self.events_url, auth=self.auth, params=params)
-            resp.raise_for_status()
-            if len(resp.json()) == 0:
-                break
-            else:
-                page = page + 1
-                events.extend(resp.json())
-
-        return events
+        if self.events is None:
+            self.events = get_pages(self.session, self.events_url)
+        return list(self.events)
 
     def get_comments(self):
-        comments = []
-        page = 0
-        while(True):
-            params = {
-                    'per_page': 100,
-                    'page': page
-            }
-            resp = requests.get(self.comments_url, auth=self.auth, params=params)
-            resp.raise_for_status()
-            if len(resp.json()) == 0:
-                break
-            else:
-                page = page + 1
-                comments.extend(resp.json())
-
-        return comments
+        if self.comments is None:
+            self.comments = get_pages(self.session, self.comments_url)
+        return list(self.comments)
 
     def who_approved(self):
+        if 'approver' not in self.cached:
+            self.cached['approver'] = self.find_approver()
+        return self.cached['approver']
+
+    def find_approver(self):
         events = self.get_events()
         # We should reverse the list as we want to figure out who gave the last approval
         events.reverse()
@@ -87,17 +138,21 @@ class Issue:
         return the_reporter
 
     def get_cvedb_json(self):
-        cvedb_json = ""
+        # The body doesn't change under us, so it only gets parsed once
+        if self.cvedb_data is not None:
+            return self.cvedb_data
+
+        json_lines = []
         found_json = False
 
         for l in self.lines:
             if l == "--- CVEDB JSON ---":
                 found_json = not found_json
             elif found_json is True:
-                cvedb_json = cvedb_json + l
+                json_lines.append(l)
 
-        cvedb_data = json.loads(cvedb_json)
-        return cvedb_data
+        self.cvedb_data = json.loads("".join(json_lines))
+        return self.cvedb_data
 
     def add_comment(self, comment):
         body = {
@@ -108,8 +163,9 @@ class Issue:
             "accept": "application/json"
         }
 
-        resp = requests.post(self.comments_url, json=body, auth=self.auth, headers=headers)
+        resp = self.session.post(self.comments_url, json=body, headers=headers)
         resp.raise_for_status()
+        self.invalidate()
 
     def can_to_cvedb(self):
         can_id = self.get_cvedb_id()
@@ -130,8 +186,9 @@ class Issue:
         headers = {
             "accept": "application/json"
         }
-        resp = requests.post(self.url, json=body, auth=self.auth, headers=headers)
+        resp = self.session.post(self.url, json=body, headers=headers)
         resp.raise_for_status()
+        self.invalidate()
 
     def assign_cvedb(self, cvedb_id, approved_user = False):
 
@@ -154,6 +211,7 @@ class Issue:
             # CAN IDs get the candidate label
             body["labels"] = ["assigned", "candidate"]
 
-        resp = requests.post(self.url, json=body, auth=self.auth, headers=headers)
+        resp = self.session.post(self.url, json=body, headers=headers)
         resp.raise_for_status()
+        self.invalidate()
 
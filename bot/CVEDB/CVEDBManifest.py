@@ -0,0 +1,127 @@
+import os
+import json
+
+# Listing the IDs used to mean walking the whole checkout, .git included.
+# The IDs only ever live in <year>/<block>xxx/<id>.json so that's all we
+# look at, and the years and blocks can be narrowed down by range before
+# we read a single directory.
+
+def get_range(the_range):
+    # A range is a (first, last) pair, either end can be None. A single
+    # year or block works too
+    if the_range is None:
+        return (None, None)
+    if isinstance(the_range, (int, str)):
+        return (int(the_range), int(the_range))
+    (first, last) = the_range
+    if first is not None:
+        first = int(first)
+    if last is not None:
+        last = int(last)
+    return (first, last)
+
+def in_range(num, the_range):
+    (first, last) = the_range
+    if first is not None and num < first:
+        return False
+    if last is not None and num > last:
+        return False
+    return True
+
+def get_block(name):
+    # "1000xxx" is block 1000, anything else isn't a block
+    if not name.endswith("xxx") or not name[0:-3].isdigit():
+        return None
+    return int(name[0:-3])
+
+def scan_ids(repo_dir, years=None, blocks=None):
+    # Yields (id, path) for every ID file on disk, in order
+    years = get_range(years)
+    blocks = get_range(blocks)
+
+    year_dirs = [i for i in os.scandir(repo_dir)
+                 if i.name.isdigit() and in_range(int(i.name), years) and i.is_dir()]
+    for year in sorted(year_dirs, key=lambda i: i.name):
+        block_dirs = [i for i in os.scandir(year.path)
+                      if get_block(i.name) is not None and in_range(get_block(i.name), blocks) and i.is_dir()]
+        for block in sorted(block_dirs, key=lambda i: get_block(i.name)):
+            files = [i for i in os.scandir(block.path) if i.name.endswith(".json")]
+            for i in sorted(files, key=lambda i: i.name):
+                yield (i.name[0:-5], i.path)
+
+class IDManifest:
+    # Every ID in a commit, from git ls-tree instead of the disk. This
+    # works for a sparse checkout where most of the years aren't there.
+    # It's cached in the .git directory next to the allocator index and
+    # only built again when HEAD moves.
+
+    def __init__(self, repo, manifest_file):
+        self.repo = repo
+        self.manifest_file = manifest_file
+        self.head = None
+        self.years = {}
+
+    def load(self):
+        if not os.path.exists(self.manifest_file):
+            return
+
+        try:
+            with open(self.manifest_file) as fh:
+                manifest = json.load(fh)
+        except ValueError:
+            # A broken manifest is the same as no manifest
+            return
+
+        self.head = manifest["head"]
+        self.years = manifest["years"]
+
+    def save(self):
+        manifest = {
+            "head": self.head,
+            "years": self.years
+        }
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, 'w') as fh:
+            fh.write(json.dumps(manifest))
+        os.replace(tmp_file, self.manifest_file)
+
+    def build(self, head):
+        # years is {year: {block: [ids]}}
+        years = {}
+        # The tree of the commit, not the index, staged files that aren't
+        # committed yet don't belong to head
+        for path in self.repo.git.ls_tree("-r", "--name-only", "-z", head).split("\0"):
+            parts = path.split("/")
+            if len(parts) != 3 or not parts[0].isdigit() or not parts[2].endswith(".json"):
+                continue
+            if get_block(parts[1]) is None:
+                continue
+            years.setdefault(parts[0], {}).setdefault(parts[1][0:-3], []).append(parts[2][0:-5])
+
+        for year in years:
+            for block in years[year]:
+                years[year][block].sort()
+
+        self.head = head
+        self.years = years
+        self.save()
+
+    def check_head(self):
+        head = self.repo.head.commit.hexsha
+        if self.head is None:
+            self.load()
+        if head != self.head:
+            self.build(head)
+
+    def scan(self, years=None, blocks=None):
+        # Yields (id, path) like scan_ids(), the paths might not exist on
+        # disk if this is a sparse checkout
+        self.check_head()
+        years = get_range(years)
+        blocks = get_range(blocks)
+
+        for year in sorted([i for i in self.years if in_range(int(i), years)]):
+            for block in sorted([i for i in self.years[year] if in_range(int(i), blocks)], key=int):
+                block_dir = os.path.join(self.repo.working_tree_dir, year, "%sxxx" % block)
+                for the_id in self.years[year][block]:
+                    yield (the_id, os.path.join(block_dir, the_id + ".json"))
@@ -4,21 +4,130 @@ import git
 import os
 import json
 import datetime
+from .CVEDBAllocator import IDAllocator
+from .CVEDBBulk import BulkRewrite
+from .CVEDBManifest import IDManifest, scan_ids
 
 class CVEDBRepo:
-    def __init__(self, repo_url, testing=False):
+    def __init__(self, repo_url, testing=False, repo_dir=None, shallow=False, sparse=False):
 
+        # If repo_dir is set we keep a persistent working copy there and
+        # only fetch what changed, otherwise we do a throwaway clone
         self.testing = testing
-        self.tmpdir = tempfile.TemporaryDirectory()
-        self.repo = git.Repo.clone_from(repo_url, self.tmpdir.name)
-        allow_list_files = os.path.join(self.tmpdir.name, "allowlist.json")
+        self.batch = None
+        self.allowlist_hash = None
+        self.shallow = shallow
+        self.sparse = sparse
+        self.tmpdir = None
+        self.manifest = None
+
+        if repo_dir is None:
+            self.tmpdir = tempfile.TemporaryDirectory()
+            self.repo_dir = self.tmpdir.name
+        else:
+            self.repo_dir = repo_dir
+
+        if os.path.exists(os.path.join(self.repo_dir, ".git")):
+            self.repo = git.Repo(self.repo_dir)
+            self.allocator = self.get_allocator()
+            self.refresh()
+        else:
+            self.repo = self.clone(repo_url)
+            self.allocator = self.get_allocator()
+            self.allocator.check_head(self.repo.head.commit.hexsha)
+            self.load_allowlist()
+
+    def get_allocator(self):
+        index_file = os.path.join(self.repo.git_dir, "cvedb-allocator.json")
+        return IDAllocator(self.repo_dir, index_file)
+
+    def clone(self, repo_url):
+        clone_args = {}
+        if self.shallow:
+            clone_args["depth"] = 1
+        if self.sparse:
+            # A sparse clone only has the top level files (allowlist.json)
+            # checked out, we add the years we need as we go
+            clone_args["sparse"] = True
+            clone_args["filter"] = "blob:none"
+
+        the_repo = git.Repo.clone_from(repo_url, self.repo_dir, **clone_args)
+
+        if self.sparse:
+            the_repo.git.sparse_checkout("add", str(datetime.datetime.now().year))
+        return the_repo
+
+    def refresh(self):
+        # Bring the working copy up to date with the remote, throwing away
+        # anything left behind by a previous run
+        branch = self.repo.active_branch.name
+        if self.shallow:
+            self.repo.remotes.origin.fetch(branch, depth=1)
+        else:
+            self.repo.remotes.origin.fetch(branch)
+        self.repo.git.reset("--hard", "origin/%s" % branch)
+        self.repo.git.clean("-fd")
+        self.allocator.discard_pending()
+        self.allocator.check_head(self.repo.head.commit.hexsha)
+
+        if self.sparse:
+            self.add_year(str(datetime.datetime.now().year))
+
+        self.load_allowlist()
+
+    def add_year(self, year):
+        # Make sure a year directory is part of a sparse checkout
+        if not self.sparse:
+            return
+        if os.path.exists(os.path.join(self.repo_dir, year)):
+            return
+        self.repo.git.sparse_checkout("add", year)
+
+    def load_allowlist(self):
+        # Only read the allowlist again if its blob changed
+        blob_hash = self.get_allowlist_hash()
+        if blob_hash is not None and blob_hash == self.allowlist_hash:
+            return
+
+        allow_list_files = os.path.join(self.repo_dir, "allowlist.json")
         with open(allow_list_files) as json_file:
             self.allowed_users = json.loads(json_file.read())
 
+        # Entries look like login:id, we look people up by their numeric ID
+        # and keep a second index by login
+        self.allowed_ids = {}
+        self.allowed_logins = {}
+        for i in self.allowed_users:
+            if ':' not in i:
+                continue
+            (login, user_id) = i.rsplit(':', 1)
+            if not user_id.isdigit():
+                continue
+            self.allowed_ids[int(user_id)] = login
+            self.allowed_logins[login] = int(user_id)
+
+        self.allowlist_hash = blob_hash
+
+    def get_allowlist_hash(self):
+        # After a refresh the working copy matches HEAD, so the blob in the
+        # tree tells us if the file changed without reading it
+        try:
+            return (self.repo.head.commit.tree / "allowlist.json").hexsha
+        except (KeyError, ValueError):
+            return None
+
     def approved_user(self, user='', user_name=None, user_id=None):
-        if user_name is not None and user_id is not None:
-            user="%s:%s" % (user_name, user_id)
-        return user in self.allowed_users
+        if user_name is None or user_id is None:
+            # user is login:id
+            if user is None or ':' not in user:
+                return False
+            (user_name, user_id) = user.rsplit(':', 1)
+
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            return False
+        return self.allowed_ids.get(user_id) == user_name
 
     def update_id(self, the_id, the_data):
 
@@ -50,6 +159,7 @@ class CVEDBRepo:
         filename = "%s.json" % (cvedb_id)
 
         can_file = os.path.join(year, namespace, filename)
+        self.add_year(year)
         git_file = os.path.join(self.repo.working_dir, can_file)
         
         # Open the file
@@ -57,16 +167,19 @@ class CVEDBRepo:
                 # Read the json
                 can_data = json.loads(json_file.read())
 
-        # Swap the CAN to CVEDB
-        can_data['OSV']['id'] = cvedb_id
+        try:
+            # Swap the CAN to CVEDB
+            can_data['OSV']['id'] = cvedb_id
 
-        # save the json
-        self.update_id(cvedb_id, can_data)
+            # save the json
+            self.update_id(cvedb_id, can_data)
 
-        # Commit the file
-        self.repo.index.add(can_file)
-        self.commit("Promoted to %s for #%s" % (cvedb_id, cvedb_issue.id))
-        self.push()
+            # Commit the file
+            self.repo.index.add(can_file)
+            self.save("Promoted to %s for #%s" % (cvedb_id, cvedb_issue.id))
+        except Exception:
+            self.discard_file(can_file)
+            raise
         return cvedb_id
 
     def add_cvedb(self, cvedb_issue):
@@ -80,35 +193,120 @@ class CVEDBRepo:
 
         (cvedb_id, cvedb_path) = self.get_next_cvedb_path(approved_user)
 
-        new_cvedb_data = self.get_cvedb_json_format(cvedb_id, cvedb_data)
-        cvedb_json = json.dumps(new_cvedb_data, indent=2)
-        cvedb_json = cvedb_json + "\n"
+        try:
+            new_cvedb_data = self.get_cvedb_json_format(cvedb_id, cvedb_data)
+            cvedb_json = json.dumps(new_cvedb_data, indent=2)
+            cvedb_json = cvedb_json + "\n"
 
-        with open(os.path.join(self.repo.working_dir, cvedb_path), 'w') as json_file:
-            json_file.write(cvedb_json)
+            with open(os.path.join(self.repo.working_dir, cvedb_path), 'w') as json_file:
+                json_file.write(cvedb_json)
 
-        self.repo.index.add(cvedb_path)
-        self.commit("Add %s for %s" % (cvedb_id, cvedb_issue.html_url))
-        self.push()
+            self.repo.index.add(cvedb_path)
+            self.save("Add %s for %s" % (cvedb_id, cvedb_issue.html_url))
+        except Exception:
+            # Take the file back out and let the next issue have the ID
+            self.discard_file(cvedb_path)
+            self.allocator.release(cvedb_id.replace("CAN", "CVEDB"))
+            raise
 
         return cvedb_id
 
+    def discard_file(self, path):
+        # Put a file back the way it is in HEAD, for a change we gave up on
+        # in the middle of a batch
+        path = os.path.relpath(os.path.join(self.repo_dir, path), self.repo_dir)
+        self.repo.git.reset("-q", "HEAD", "--", path)
+        try:
+            self.repo.head.commit.tree / path
+        except KeyError:
+            if os.path.exists(os.path.join(self.repo_dir, path)):
+                os.remove(os.path.join(self.repo_dir, path))
+            return
+        self.repo.git.checkout("HEAD", "--", path)
+
     def commit(self, message):
         # Don't commit if we're testing
         if self.testing:
             pass
         else:
             self.repo.index.commit(message)
+            self.allocator.set_head(self.repo.head.commit.hexsha)
 
-    def push(self):
+    def push(self, retries=3):
         # Don't push if we're testing
         if self.testing:
-            pass
+            return
+
+        branch = self.repo.active_branch.name
+        for attempt in range(retries + 1):
+            try:
+                self.repo.git.push("origin", branch)
+                return
+            except git.exc.GitCommandError as e:
+                # Anything but a rejected push (auth, network) won't get
+                # better with a rebase
+                if attempt == retries or not self.push_rejected(e):
+                    raise
+            # Somebody else pushed first, put our commits on top of theirs
+            self.rebase(branch)
+
+    def push_rejected(self, error):
+        # The remote has commits we don't, "fetch first" when our branch
+        # is behind and "non-fast-forward" when it has diverged
+        stderr = str(error.stderr)
+        return "[rejected]" in stderr and ("fetch first" in stderr or "non-fast-forward" in stderr)
+
+    def rebase(self, branch):
+        self.repo.remotes.origin.fetch(branch)
+        try:
+            self.repo.git.rebase("origin/%s" % branch)
+        except git.exc.GitCommandError:
+            self.repo.git.rebase("--abort")
+            raise
+        # The new commits might have IDs the allocator doesn't know about
+        self.allocator.check_head(self.repo.head.commit.hexsha)
+
+    def save(self, message):
+        # Commit and push the staged files, unless we're in a batch in which
+        # case it waits for finish_batch()
+        if self.batch is None:
+            self.commit(message)
+            self.push()
+            return
+
+        self.batch.append(message)
+        if self.batch_size > 0 and len(self.batch) >= self.batch_size:
+            self.commit_batch()
+
+    def start_batch(self, batch_size=0):
+        # Everything saved until finish_batch() gets committed together and
+        # pushed once. batch_size caps how many changes go in one commit,
+        # 0 means everything goes in a single commit
+        self.batch = []
+        self.batch_size = batch_size
+        self.batch_commits = 0
+
+    def commit_batch(self):
+        if len(self.batch) == 0:
+            return
+        if len(self.batch) == 1:
+            message = self.batch[0]
         else:
-            self.repo.remotes.origin.push()
+            message = "Update %d IDs\n\n%s" % (len(self.batch), "\n".join(self.batch))
+        self.commit(message)
+        self.batch = []
+        self.batch_commits = self.batch_commits + 1
+
+    def finish_batch(self):
+        self.commit_batch()
+        if self.batch_commits > 0:
+            self.push()
+        self.batch = None
 
     def close(self):
-        self.tmpdir.cleanup()
+        # A persistent working copy is kept for the next run
+        if self.tmpdir is not None:
+            self.tmpdir.cleanup()
 
     def get_id(self, the_id):
         the_data = None
@@ -117,74 +315,72 @@ class CVEDBRepo:
             the_data = json.load(fh)
         return the_data
 
+    def bulk_rewrite(self, transform, workers=None, dry_run=False, years=None, blocks=None):
+        # Runs transform(the_id, the_data) over every ID and stages the
+        # files that changed, see CVEDBBulk
+        return BulkRewrite(self, transform, workers, dry_run).run(years=years, blocks=blocks)
+
     def get_file(self, the_id):
         (year, id_only) = the_id.split('-')[1:3]
         block_num = int(int(id_only)/1000)
         block_path = "%dxxx" % block_num
-        id_path = os.path.join(self.tmpdir.name, year, block_path, the_id + ".json")
+        id_path = os.path.join(self.repo_dir, year, block_path, the_id + ".json")
         return id_path
 
-    def get_all_ids(self):
+    def get_manifest(self):
+        if self.manifest is None:
+            manifest_file = os.path.join(self.repo.git_dir, "cvedb-manifest.json")
+            self.manifest = IDManifest(self.repo, manifest_file)
+        return self.manifest
+
+    def iter_ids(self, years=None, blocks=None, manifest=False):
+        # Yields the CVEDB IDs in order. years and blocks are (first, last)
+        # ranges, or a single year or block. With manifest=True the IDs come
+        # from the commit instead of the disk, see CVEDBManifest
+        if manifest:
+            the_ids = self.get_manifest().scan(years, blocks)
+        else:
+            the_ids = scan_ids(self.repo_dir, years, blocks)
 
-        cvedb_ids = []
-        for root,d_names,f_names in os.walk(self.tmpdir.name):
-            # Skip the .git directories
-            if '.git' in root:
-                continue
+        for (the_id, path) in the_ids:
+            if the_id.startswith('CVEDB-'):
+                yield the_id
 
-            for i in f_names:
-                if 'CVEDB-' in i:
-                    id_only = i.split('.')[0]
-                    cvedb_ids.append(id_only)
-        return cvedb_ids
+    def get_all_ids(self, years=None, blocks=None, manifest=False):
+        return list(self.iter_ids(years, blocks, manifest))
 
     def get_next_cvedb_path(self, approved_user = False):
         # Returns the next CVEDB ID and the path where it should go
-        # This needs a lot more intelligence, but it'll be OK for the first pass. There are plenty of integers
-        cvedb_path = None
-        the_cvedb = None
+        return self.get_next_cvedb_paths(1, approved_user)[0]
+
+    def get_next_cvedb_paths(self, count, approved_user = False):
+        # Returns a list of the next count CVEDB IDs and the paths where
+        # they should go. The allocator remembers the highest ID in each
+        # block so this doesn't have to look at the directories
+        to_return = []
 
         # Get the current year
         year = str(datetime.datetime.now().year)
-        year_dir = os.path.join(self.tmpdir.name, year)
+        year_dir = os.path.join(self.repo_dir, year)
 
         # Make sure the year directory exists
         if not os.path.exists(year_dir):
             os.mkdir(year_dir)
 
-        # Start looking in directory 1000xxx
-        # If that's full, move to 1001xxx
-        # We will consider our namespace everything up to 1999999
-        for i in range(1000, 2000, 1):
-            block_dir = "%sxxx" % i
-            block_path = os.path.join(year_dir, block_dir)
+        for next_id in self.allocator.allocate(year, count):
+            the_cvedb = "CVEDB-%s-%s" % (year, next_id)
+            cvedb_path = self.get_file(the_cvedb)
+
+            block_path = os.path.dirname(cvedb_path)
             if not os.path.exists(block_path):
                 # This is a new path with no files
                 os.mkdir(block_path)
-                the_cvedb = "CVEDB-%s-%s000" % (year, i)
-                cvedb_path = os.path.join(block_path, "%s.json" % the_cvedb)
-                if not approved_user:
-                    the_cvedb = "CAN-%s-%s000" % (year, i)
-                break
-
-            else:
-                
-                files = os.listdir(block_path)
-                files.sort()
-                last_file = files[-1]
-                id_num = int(last_file.split('.')[0].split('-')[2])
-                next_id = id_num + 1
-                if next_id % 1000 == 0:
-                    # It's time to roll over, we'll pick up the ID in the next loop
-                    continue
-
-                the_cvedb = "CVEDB-%s-%s" % (year, next_id)
-                cvedb_path = os.path.join(block_path, "%s.json" % the_cvedb)
-                if not approved_user:
-                    the_cvedb = "CAN-%s-%s" % (year, next_id)
-                break
-
-        return (the_cvedb, cvedb_path)
+
+            if not approved_user:
+                the_cvedb = "CAN-%s-%s" % (year, next_id)
+            to_return.append((the_cvedb, cvedb_path))
+
+        return to_return
 
     def get_osv_json_format(self, cvedb_id, issue_data):
 
@@ -0,0 +1,144 @@
+import requests
+import os
+import time
+import threading
+from .CVEDBCache import CachedResponse, get_cache
+
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+class GithubSession:
+    # Everything that talks to the GitHub API goes through one of these.
+    # It keeps a pool of connections open, retries rate limits and (for
+    # requests that are safe to send twice) server errors with a backoff,
+    # slows down when we're close to running out of rate limit, and uses
+    # the response cache if there is one.
+    #
+    # Pass your own to get_new_issues()/Issue() or call set_session() to
+    # point the bot somewhere else, like a fake server in the tests.
+
+    def __init__(self, username=None, token=None, cache=None, retries=5, backoff=1.0,
+                 min_remaining=100, pool_size=16):
+        self.username = username
+        self.cache = cache
+        self.retries = retries
+        self.backoff = backoff
+        self.min_remaining = min_remaining
+        self.sleep = time.sleep
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if username is not None and token is not None:
+            self.session.auth = (username, token)
+
+        # The rate limit headers from the last response we saw
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+
+    def get_retry_delay(self, resp, attempt, idempotent=True):
+        # Returns how long to wait before trying again, None means don't.
+        # A request that isn't idempotent only gets sent again if GitHub
+        # said it was rate limited, anything else might have gone through
+        if resp.status_code >= 500 and idempotent:
+            return self.backoff * (2 ** attempt)
+
+        if resp.status_code in [403, 429]:
+            if 'Retry-After' in resp.headers:
+                # Secondary rate limit, GitHub tells us how long to wait
+                return int(resp.headers['Retry-After'])
+            if resp.headers.get('X-RateLimit-Remaining') == '0':
+                # Out of primary rate limit, wait until it resets. Not
+                # everything that says so tells us when that is
+                reset = resp.headers.get('X-RateLimit-Reset', '')
+                if not reset.isdigit():
+                    return self.backoff * (2 ** attempt)
+                return max(int(reset) - time.time(), 0) + 1
+            if 'secondary rate limit' in resp.text and idempotent:
+                return self.backoff * (2 ** attempt) * 60
+
+        return None
+
+    def throttle(self, resp):
+        # Spread what's left of the rate limit over the time until it resets
+        if 'X-RateLimit-Remaining' not in resp.headers:
+            return
+
+        with self.lock:
+            self.remaining = int(resp.headers['X-RateLimit-Remaining'])
+            self.reset = int(resp.headers.get('X-RateLimit-Reset', 0))
+            if self.remaining >= self.min_remaining:
+                return
+            delay = (self.reset - time.time()) / max(self.remaining, 1)
+
+        if delay > 0:
+            self.sleep(delay)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        # POSTs and PATCHes aren't retried after a server or connection
+        # error, sending a comment twice is worse than not sending it. Pass
+        # idempotent=True for a POST that only reads, like a GraphQL query
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt == self.retries or not idempotent:
+                    raise
+                self.sleep(self.backoff * (2 ** attempt))
+                continue
+
+            delay = self.get_retry_delay(resp, attempt, idempotent)
+            if delay is None or attempt == self.retries:
+                break
+            self.sleep(delay)
+
+        self.throttle(resp)
+        return resp
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        if self.cache is None:
+            return self.request('GET', url, params=params, headers=headers, **kwargs)
+
+        # Send what we know about the last response, if nothing changed
+        # GitHub sends a 304 that doesn't count against the rate limit
+        cache_file = self.cache.get_file(url, params)
+        entry = self.cache.load(cache_file)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        resp = self.request('GET', url, params=params, headers=headers, **kwargs)
+
+        if resp.status_code == 304 and entry is not None:
+            self.cache.touch(cache_file)
+            return CachedResponse(entry)
+
+        if resp.status_code == 200 and \
+           ("ETag" in resp.headers or "Last-Modified" in resp.headers):
+            self.cache.store(cache_file, resp)
+
+        return resp
+
+    def post(self, url, idempotent=False, **kwargs):
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+the_session = None
+
+def get_session():
+    # The default session logs in with the bot's credentials
+    global the_session
+    if the_session is None:
+        the_session = GithubSession(os.environ['GH_USERNAME'], os.environ['GH_TOKEN'], get_cache())
+    return the_session
+
+def set_session(session):
+    global the_session
+    the_session = session
@@ -2,3 +2,9 @@
 from .CVEDBIssue import *
 from .CVEDBRepo import *
 from .CVEDBGithub import *
+from .CVEDBAllocator import *
+from .CVEDBCache import *
+from .CVEDBSession import *
+from .CVEDBBot import *
+from .CVEDBBulk import *
+from .CVEDBManifest import *
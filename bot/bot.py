@@ -1,56 +1,60 @@
 #!/usr/bin/env python3
 
 import os
-import re
+import sys
 import datetime
 import time
 import CVEDB
 
 repo_name = os.environ['GH_REPO']
-issues_url = "https://api.github.com/repos/%s/issues" % repo_name
-repo_url = "https://github.com/%s.git" % repo_name
 username = os.environ['GH_USERNAME']
 
+# Keep a working copy of the repo here between runs instead of cloning
+# the whole database every time there's work to do
+repo_dir = os.environ.get('CVEDB_REPO_DIR')
+repo_shallow = os.environ.get('CVEDB_REPO_SHALLOW', '') == '1'
+repo_sparse = os.environ.get('CVEDB_REPO_SPARSE', '') == '1'
 
-def main():
+# Fetch the issues with their comments and events in a few GraphQL
+# queries instead of a REST call or two for every issue
+use_graphql = os.environ.get('CVEDB_GRAPHQL', '') == '1'
 
-    start_time = datetime.datetime.now()
+# How many IDs go in one commit, 0 puts a whole run in a single commit
+commit_size = int(os.environ.get('CVEDB_COMMIT_SIZE', '0'))
 
-    new_issues = CVEDB.get_new_issues(issues_url)
-    can_issues = CVEDB.get_approved_can_issues(issues_url)
+# How many issues we talk to GitHub about at the same time
+workers = int(os.environ.get('CVEDB_WORKERS', '4'))
 
-    if len(new_issues) > 0 or len(can_issues) > 0:
+# Stay running instead of exiting after every cycle. The poll interval
+# starts at the minimum and doubles while there's nothing to do
+daemon_mode = os.environ.get('CVEDB_DAEMON', '') == '1' or '--daemon' in sys.argv
+min_interval = int(os.environ.get('CVEDB_MIN_INTERVAL', '10'))
+max_interval = int(os.environ.get('CVEDB_MAX_INTERVAL', '300'))
 
-        # Only touch the repo if we have work to do
-        cvedb_repo = CVEDB.GSDRepo(repo_url)
+# POSTing to this port makes the daemon run a cycle right away
+webhook_port = os.environ.get('CVEDB_WEBHOOK_PORT')
+webhook_host = os.environ.get('CVEDB_WEBHOOK_HOST', '127.0.0.1')
+webhook_secret = os.environ.get('CVEDB_WEBHOOK_SECRET')
 
-        # Look for new issues
-        for i in new_issues:
 
-            if re.search('(CVEDB|CAN)-\d{4}-\d+', i.title):
-                # There shouldn't be a CVEDB/CAN ID in the title, bail on this issue
-                print("Found an ID in the title for issue %s" % i.id)
-                continue
+def get_bot():
+    return CVEDB.Bot(repo_name, repo_dir=repo_dir, shallow=repo_shallow, sparse=repo_sparse,
+                     graphql=use_graphql, commit_size=commit_size, workers=workers)
 
-            if not cvedb_repo.approved_user(user_name=i.creator, user_id=i.creator_id):
-                print("Issue %s is not created by an approved user" % (i.id))
-                continue
+def daemon():
+    port = None
+    if webhook_port is not None:
+        port = int(webhook_port)
+    the_daemon = CVEDB.Daemon(get_bot(), min_interval, max_interval, port, webhook_host, webhook_secret)
+    the_daemon.run()
 
-            print("Updating issue %s" % i.id)
-            cvedb_id = cvedb_repo.add_cvedb(i)
-            i.assign_cvedb(cvedb_id, cvedb_repo.approved_user(i.get_reporter()))
+def main():
 
-        # Now look for approved CAN issues
-        for i in can_issues:
-            approver = i.who_approved()
-            if cvedb_repo.approved_user(approver):
-                # Flip this to a CVEDB
-                cvedb_repo.can_to_cvedb(i)
-                i.can_to_cvedb()
-            else:
-                print("%s is unapproved for %s" % (approver, i.id))
+    start_time = datetime.datetime.now()
 
-        cvedb_repo.close()
+    cvedb_bot = get_bot()
+    cvedb_bot.run_cycle()
+    cvedb_bot.close()
 
     stop_time = datetime.datetime.now()
     total_time = stop_time - start_time
@@ -59,6 +63,9 @@ def main():
     if total_seconds < 10:
         # Things get weird if we die too early wtih docker-compose
         time.sleep(10 - total_seconds)
-    
+
 if __name__ == "__main__":
-    main()
+    if daemon_mode:
+        daemon()
+    else:
+        main()
@@ -1,29 +1,14 @@
 #!/usr/bin/env python
 
 import datetime
-import pathlib
-import UVI
+import CVEDB
+import sys
 import os
 
-repo_name = os.environ['GH_REPO']
-repo_url = "https://github.com/%s.git" % repo_name
-username = os.environ['GH_USERNAME']
+def update_summary(the_id, the_data):
 
-# Check out the repo
-
-uvi_repo = UVI.UVIRepo(repo_url)
-
-# Gather all the files
-
-all_ids = uvi_repo.get_all_ids()
-
-# Load data
-
-for i in all_ids:
-    print(i)
-    the_data = uvi_repo.get_id(i)
-
-    uvi_data = the_data["uvi"]
+    uvi_data = the_data["CVEDB"]
+    old_summary = (the_data["OSV"].get("summary"), the_data["OSV"].get("details"))
 
     # We will do something special for the kernel
     if uvi_data["vendor_name"] == "Linux" and \
@@ -44,11 +29,33 @@ for i in all_ids:
         the_data["OSV"]["summary"] = summary
         the_data["OSV"]["details"] = uvi_data["description"]
 
+    # Leave the modified time alone if nothing changed
+    if (the_data["OSV"]["summary"], the_data["OSV"]["details"]) == old_summary:
+        return None
+
     the_time =  datetime.datetime.utcnow().isoformat() + "Z"
     the_data["OSV"]["modified"] = the_time
 
-    # Write file and add to commit
-    uvi_repo.update_id(i, the_data)
+    return the_data
+
+if __name__ == "__main__":
+    repo_name = os.environ['GH_REPO']
+    repo_url = "https://github.com/%s.git" % repo_name
+    username = os.environ['GH_USERNAME']
+
+    # --dry-run just counts the IDs that would change
+    dry_run = '--dry-run' in sys.argv
+
+    # Check out the repo
+
+    uvi_repo = CVEDB.CVEDBRepo(repo_url)
+
+    # Rewrite every ID, the changed files get added to the commit
+
+    stats = uvi_repo.bulk_rewrite(update_summary, dry_run=dry_run)
+    print("Updated %d of %d IDs" % (stats["changed"], stats["scanned"]))
 
-uvi_repo.commit("Update OSV summary")
-uvi_repo.push()
+    # Nothing changed means nothing to commit
+    if not dry_run and stats["changed"] > 0:
+        uvi_repo.commit("Update OSV summary")
+        uvi_repo.push()
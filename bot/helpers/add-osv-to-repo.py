@@ -2,31 +2,19 @@
 
 import datetime
 import pathlib
-import UVI
+import CVEDB
+import sys
 import os
 
-repo_name = os.environ['GH_REPO']
-repo_url = "https://github.com/%s.git" % repo_name
-username = os.environ['GH_USERNAME']
+# The checkout, the transform needs it to build the OSV data
+uvi_repo = None
 
-# Check out the repo
-
-uvi_repo = UVI.UVIRepo(repo_url)
-
-# Gather all the files
-
-all_ids = uvi_repo.get_all_ids()
-
-# Load data
-
-for i in all_ids:
-    print(i)
-    the_data = uvi_repo.get_id(i)
+def add_osv(i, the_data):
 
     # If not namespace
     if "OSV" not in the_data:
 
-        issue_data = the_data["uvi"]
+        issue_data = the_data["CVEDB"]
 
         if "description" not in issue_data:
             issue_data["description"] = the_data["description"]["description_data"][0]["value"]
@@ -64,8 +52,28 @@ for i in all_ids:
         new_time = datetime.datetime.fromtimestamp(ctime).isoformat() + "Z"
         the_data["OSV"]["published"] = new_time
 
-        # Write file and add to commit
-        uvi_repo.update_id(i, the_data)
+        return the_data
+
+    return None
+
+if __name__ == "__main__":
+    repo_name = os.environ['GH_REPO']
+    repo_url = "https://github.com/%s.git" % repo_name
+    username = os.environ['GH_USERNAME']
+
+    # --dry-run just counts the IDs that would change
+    dry_run = '--dry-run' in sys.argv
+
+    # Check out the repo
+
+    uvi_repo = CVEDB.CVEDBRepo(repo_url)
+
+    # Rewrite every ID, the changed files get added to the commit
+
+    stats = uvi_repo.bulk_rewrite(add_osv, dry_run=dry_run)
+    print("Updated %d of %d IDs" % (stats["changed"], stats["scanned"]))
 
-uvi_repo.commit("Add OSV data")
-uvi_repo.push()
+    # Nothing changed means nothing to commit
+    if not dry_run and stats["changed"] > 0:
+        uvi_repo.commit("Add OSV data")
+        uvi_repo.push()
@@ -1,47 +1,29 @@
 #!/usr/bin/env python
 
 import sys
-import os
-import glob
-import json
+import CVEDB
 
 db_path = sys.argv[1]
 
-os.chdir(db_path)
+def rename_uvi(old_id, new_id, data):
 
-files = glob.glob('2021/*/*.json', recursive=True)
+    new_data = {}
 
-for f in files:
-    filename = os.path.basename(f)
-    dirname = os.path.dirname(f)
+    for i in data:
+        if i == 'UVI' or i == 'uvi':
+            new_data['CVEDB'] = data[i]
+        else:
+            new_data[i] = data[i]
 
-    if filename[0:2] == 'CVEDB':
-        continue
+    if 'OSV' in new_data:
+        new_data['OSV']['id'] = new_id
 
-    with open(f, 'r+') as fh:
+    return new_data
 
-        new_data = {}
+# Renames every UVI ID in one go, if this gets interrupted just run it
+# again and it picks up where it stopped
 
-        data = json.load(fh)
-
-        for i in data:
-            if i == 'UVI' or i == 'uvi':
-                new_data['CVEDB'] = data[i]
-            else:
-                new_data[i] = data[i]
-
-        if 'OSV' in new_data:
-            old_id = new_data['OSV']['id']
-            new_id = 'CVEDB' + old_id[3:]
-            new_data['OSV']['id'] = new_id
-
-        new_file = 'CVEDB' + filename[3:]
-        new_filename = os.path.join(dirname, new_file)
-
-        to_write = json.dumps(new_data, indent=2)
-        to_write = to_write + "\n"
-
-        fh.seek(0)
-        fh.write(to_write)
-    print(new_filename)
-    os.system("git mv %s %s" % (f, new_filename))
+stats = CVEDB.BulkRename(db_path, 'UVI', 'CVEDB', rename_uvi).run()
+if stats["resumed"] > 0:
+    print("Resumed %d renames from an earlier run" % stats["resumed"])
+print("Renamed %d IDs, %d staged" % (stats["renamed"], stats["staged"]))
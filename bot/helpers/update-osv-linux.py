@@ -2,47 +2,53 @@
 
 import datetime
 import pathlib
-import UVI
+import CVEDB
+import sys
 import os
 
-repo_name = os.environ['GH_REPO']
-repo_url = "https://github.com/%s.git" % repo_name
-username = os.environ['GH_USERNAME']
+def update_ecosystem(i, the_data):
 
-# Check out the repo
+    issue_data = the_data["CVEDB"]
 
-uvi_repo = UVI.UVIRepo(repo_url)
-
-# Gather all the files
-
-all_ids = uvi_repo.get_all_ids()
+    # If not namespace
+    if "OSV" not in the_data:
+        # This should never happen, stop the whole rewrite
+        raise Exception("Issue %s doesn't have OSV data" % i)
+
+    if issue_data["vendor_name"] == "Linux" and \
+       issue_data["product_name"] == "Kernel":
+        # Only update kernel issues, and only the ones that still need it
+        changed = False
+        for affected in the_data["OSV"].get("affected", []):
+            if affected["package"]["ecosystem"] != "Linux":
+                affected["package"]["ecosystem"] = "Linux"
+                changed = True
+
+        if changed:
+            the_time =  datetime.datetime.utcnow().isoformat() + "Z"
+            the_data["OSV"]["modified"] = the_time
+            return the_data
 
-# Load data
+    return None
 
-for i in all_ids:
-    print(i)
-    the_data = uvi_repo.get_id(i)
+if __name__ == "__main__":
+    repo_name = os.environ['GH_REPO']
+    repo_url = "https://github.com/%s.git" % repo_name
+    username = os.environ['GH_USERNAME']
 
-    issue_data = the_data["uvi"]
+    # --dry-run just counts the IDs that would change
+    dry_run = '--dry-run' in sys.argv
 
-    # If not namespace
-    if "OSV" not in the_data:
-        # This should never happen
-        print("Something terrible has happened")
-        print("Issue %s doesn't have OSV data" % i)
-        sys.exit(1)
-    else:
+    # Check out the repo
 
-        if issue_data["vendor_name"] == "Linux" and \
-           issue_data["product_name"] == "Kernel":
-            # Only update kernel issues
-            the_data["OSV"]["package"]["ecosystem"] = "Linux"
+    uvi_repo = CVEDB.CVEDBRepo(repo_url)
 
-            the_time =  datetime.datetime.utcnow().isoformat() + "Z"
-            the_data["OSV"]["modified"] = the_time
+    # Rewrite every ID, the changed files get added to the commit
 
-            # Write file and add to commit
-            uvi_repo.update_id(i, the_data)
+    stats = uvi_repo.bulk_rewrite(update_ecosystem, dry_run=dry_run)
+    print("Updated %d of %d IDs" % (stats["changed"], stats["scanned"]))
 
-uvi_repo.commit("Update Kernel ecosystem")
-uvi_repo.push()
+    # Nothing changed means nothing to commit
+    if not dry_run and stats["changed"] > 0:
+        uvi_repo.commit("Update Kernel ecosystem")
+        uvi_repo.push()
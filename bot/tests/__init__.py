@@ -1,4 +1,10 @@
-
-from .test_GSDRepo import *
-from .test_GSDGithub import *
-from .test_GSDIssue import *
+from .test_CVEDBRepo import *
+from .test_CVEDBGithub import *
+from .test_CVEDBIssue import *
+from .test_CVEDBAllocator import *
+from .test_CVEDBCache import *
+from .test_CVEDBSession import *
+from .test_CVEDBBot import *
+from .test_CVEDBBulk import *
+from .test_CVEDBManifest import *
+from .test_helpers import *
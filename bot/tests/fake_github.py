@@ -0,0 +1,137 @@
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+import http.server
+
+# A tiny stand in for the GitHub API so the tests don't need the network
+# or any mocking. Lists get paginated with Link headers and ETags like
+# the real thing, POSTs are recorded so we can see what the bot did.
+# Set delay to make every POST take a while, max_posts is the most we
+# ever had in flight at once. fail_paths makes POSTs to a path fail.
+
+class FakeGithub:
+
+    def __init__(self):
+        self.routes = {}
+        self.failures = []
+        self.extra_headers = {}
+        self.requests = []
+        self.graphql = []
+        self.delay = 0
+        self.fail_paths = {}
+        self.posts = 0
+        self.max_posts = 0
+        self.lock = threading.Lock()
+
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, data, headers={}):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for i in fake.extra_headers:
+                    self.send_header(i, fake.extra_headers[i])
+                for i in headers:
+                    self.send_header(i, headers[i])
+                self.end_headers()
+                self.wfile.write(body)
+
+            def fail(self):
+                if len(fake.failures) == 0:
+                    return False
+                (status, headers) = fake.failures.pop(0)
+                self.send_json(status, {"message": "failure"}, headers)
+                return True
+
+            def do_GET(self):
+                the_url = urllib.parse.urlparse(self.path)
+                query = dict(urllib.parse.parse_qsl(the_url.query))
+                fake.requests.append(("GET", the_url.path, query, dict(self.headers), None))
+                if self.fail():
+                    return
+
+                if the_url.path not in fake.routes:
+                    self.send_json(404, {"message": "Not Found"})
+                    return
+
+                items = fake.routes[the_url.path]
+                per_page = int(query.get("per_page", 30))
+                page = int(query.get("page", 1))
+                last_page = max(int((len(items) + per_page - 1) / per_page), 1)
+                the_page = items[(page - 1) * per_page:page * per_page]
+
+                headers = {}
+                etag = '"%s"' % hashlib.sha1(json.dumps(the_page).encode()).hexdigest()
+                headers["ETag"] = etag
+                if page < last_page:
+                    base = "%s%s?per_page=%d&page=" % (fake.url, the_url.path, per_page)
+                    headers["Link"] = '<%s%d>; rel="next", <%s%d>; rel="last"' % (base, page + 1, base, last_page)
+
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_json(200, the_page, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or "null")
+                the_url = urllib.parse.urlparse(self.path)
+                fake.requests.append(("POST", the_url.path, {}, dict(self.headers), body))
+
+                with fake.lock:
+                    fake.posts = fake.posts + 1
+                    fake.max_posts = max(fake.max_posts, fake.posts)
+                time.sleep(fake.delay)
+                with fake.lock:
+                    fake.posts = fake.posts - 1
+
+                if the_url.path in fake.fail_paths:
+                    self.send_json(fake.fail_paths[the_url.path], {"message": "failure"})
+                    return
+                if self.fail():
+                    return
+                if the_url.path == "/graphql":
+                    # Answers are handed out in the order they were added
+                    self.send_json(200, fake.graphql.pop(0))
+                    return
+                self.send_json(200, {})
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_requests(self, method, path):
+        return [i for i in self.requests if i[0] == method and i[1] == path]
+
+    def add_issue(self, number, title="Test issue", body="", login="joshbressers", user_id=1692786,
+                  comments=[], events=[]):
+        path = "/repos/CVEDB/test/issues/%d" % number
+        issue = {
+            "number": number,
+            "title": title,
+            "body": body,
+            "url": self.url + path,
+            "html_url": "https://github.com/CVEDB/test/issues/%d" % number,
+            "comments_url": self.url + path + "/comments",
+            "events_url": self.url + path + "/events",
+            "user": {"login": login, "id": user_id}
+        }
+        self.routes[path + "/comments"] = list(comments)
+        self.routes[path + "/events"] = list(events)
+        return issue
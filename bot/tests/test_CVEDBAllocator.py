@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import tempfile
+import json
+
+import CVEDB
+
+class TestIDAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index_file = os.path.join(self.tmpdir.name, "index.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add_id(self, the_id):
+        (year, id_only) = the_id.split('-')[1:3]
+        block_dir = os.path.join(self.tmpdir.name, year, "%sxxx" % id_only[0:-3])
+        os.makedirs(block_dir, exist_ok=True)
+        with open(os.path.join(block_dir, the_id + ".json"), "w") as fh:
+            fh.write("{}")
+
+    def testEmptyYear(self):
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        self.assertEqual(allocator.allocate("2021"), [1000000])
+        self.assertEqual(allocator.allocate("2021", 3), [1000001, 1000002, 1000003])
+
+    def testRollover(self):
+        self.add_id("CVEDB-2021-1000998")
+        self.add_id("CVEDB-2021-1001005")
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        self.assertEqual(allocator.allocate("2021", 3), [1000999, 1001006, 1001007])
+
+    def testIndexReused(self):
+        self.add_id("CVEDB-2021-1000005")
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        allocator.check_head("abc")
+        the_id = allocator.allocate("2021")[0]
+        self.add_id("CVEDB-2021-%s" % the_id)
+        allocator.set_head("def")
+
+        # Without the tree the only way to know about 1000006 is the index
+        os.remove(os.path.join(self.tmpdir.name, "2021", "1000xxx", "CVEDB-2021-1000005.json"))
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        allocator.check_head("def")
+        self.assertEqual(allocator.allocate("2021"), [1000007])
+
+    def testStaleIndex(self):
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        allocator.check_head("abc")
+        allocator.allocate("2021", 2)
+
+        # Nothing was written, so the index shouldn't be trusted
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        allocator.check_head("abc")
+        self.assertEqual(allocator.allocate("2021"), [1000000])
+
+        # A new HEAD means we have to look at the tree again
+        self.add_id("CVEDB-2021-1000000")
+        self.add_id("CVEDB-2021-1000001")
+        allocator.check_head("def")
+        self.assertEqual(allocator.allocate("2021"), [1000002])
+
+    def testUnknownID(self):
+        allocator = CVEDB.IDAllocator(self.tmpdir.name, self.index_file)
+        allocator.allocate("2021")
+        self.add_id("CVEDB-2021-1000000")
+        self.add_id("CVEDB-2021-1000001")
+        self.assertEqual(allocator.allocate("2021"), [1000002])
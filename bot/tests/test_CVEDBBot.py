@@ -0,0 +1,212 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import tempfile
+import json
+import hmac
+import hashlib
+import time
+import datetime
+import threading
+import urllib.request
+import git
+import requests
+
+import CVEDB
+from .fake_github import FakeGithub
+from .test_CVEDBRepo import make_origin, set_identity
+
+def issue_body(reporter="joshbressers", reporter_id=1692786, **kwargs):
+    data = {
+        "vendor_name": "test vendor",
+        "product_name": "test product",
+        "product_version": "test version",
+        "vulnerability_type": "test type",
+        "impact": "test impact",
+        "references": ["http://example.com"],
+        "reporter": reporter,
+        "reporter_id": reporter_id,
+        "description": "test description"
+    }
+    data.update(kwargs)
+    return "--- CVEDB JSON ---\n%s\n--- CVEDB JSON ---" % json.dumps(data)
+
+class TestBot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        (self.work, self.origin) = make_origin(self.tmpdir.name)
+        self.github = FakeGithub()
+        self.github.routes["/repos/CVEDB/test/issues"] = []
+        self.session = CVEDB.GithubSession("cvedb-bot", "token")
+        self.bot = CVEDB.Bot("CVEDB/test", repo_dir=os.path.join(self.tmpdir.name, "checkout"),
+                             session=self.session, api_url=self.github.url, repo_url=self.origin)
+
+    def tearDown(self):
+        self.bot.close()
+        self.github.close()
+        self.tmpdir.cleanup()
+
+    def testRunCycle(self):
+        self.assertEqual(self.bot.run_cycle(), 0)
+        self.assertIsNone(self.bot.repo)
+
+        self.github.routes["/repos/CVEDB/test/issues"] = [
+            self.github.add_issue(1, body=issue_body()),
+            self.github.add_issue(2, body=issue_body(), login="baduser", user_id=1)
+        ]
+        self.bot.get_repo()
+        set_identity(self.bot.repo.repo)
+        the_repo = self.bot.repo
+
+        self.assertEqual(self.bot.run_cycle(), 1)
+        self.assertIs(self.bot.repo, the_repo)
+        self.assertEqual(self.bot.counters["assigned"], 1)
+        self.assertIn("github", self.bot.timings)
+
+        year = datetime.datetime.now().year
+        comments = self.github.get_requests("POST", "/repos/CVEDB/test/issues/1/comments")
+        self.assertEqual(comments[0][4]["body"], "This issue has been assigned CVEDB-%s-1000001" % year)
+        self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/2/comments")), 0)
+        commits = list(git.Repo(self.origin).iter_commits("main"))
+        self.assertTrue(commits[0].message.startswith("Add CVEDB-%s-1000001" % year))
+
+    def testBadIssue(self):
+        # The kernel issue gets an ID before it fails, the next issue gets
+        # that ID instead and the rest of the batch still goes out
+        kernel = {"vendor_name": "Linux", "product_name": "Kernel", "impact": "unspecified",
+                  "extended_references": [{"type": "web", "note": "fixed", "value": "http://example.com"}]}
+        self.github.routes["/repos/CVEDB/test/issues"] = [
+            self.github.add_issue(1, body=issue_body()),
+            self.github.add_issue(2, body=issue_body(**kernel)),
+            self.github.add_issue(3, body=issue_body())
+        ]
+        self.bot.get_repo()
+        set_identity(self.bot.repo.repo)
+
+        self.assertEqual(self.bot.run_cycle(), 2)
+        self.assertEqual(self.bot.counters["failed_issues"], 1)
+
+        year = datetime.datetime.now().year
+        for (issue, cvedb_id) in [(1, 1000001), (3, 1000002)]:
+            comments = self.github.get_requests("POST", "/repos/CVEDB/test/issues/%d/comments" % issue)
+            self.assertEqual(comments[0][4]["body"], "This issue has been assigned CVEDB-%s-%s" % (year, cvedb_id))
+        self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/2/comments")), 0)
+
+        commits = list(git.Repo(self.origin).iter_commits("main"))
+        self.assertIn("CVEDB-%s-1000001" % year, commits[0].message)
+        self.assertIn("CVEDB-%s-1000002" % year, commits[0].message)
+        self.assertEqual(sorted(commits[0].stats.files), ["%s/1000xxx/CVEDB-%s-100000%d.json" % (year, year, i)
+                                                          for i in [1, 2]])
+        self.assertFalse(self.bot.repo.repo.is_dirty(untracked_files=True))
+
+    def testParallelSideEffects(self):
+        # IDs go out in issue order, the comments and labels after that
+        # run on the pool and never more than workers at a time
+        self.bot.workers = 3
+        self.github.delay = 0.2
+        self.github.routes["/repos/CVEDB/test/issues"] = [self.github.add_issue(i, body=issue_body())
+                                                          for i in range(1, 7)]
+        self.bot.get_repo()
+        set_identity(self.bot.repo.repo)
+
+        self.assertEqual(self.bot.run_cycle(), 6)
+        self.assertEqual(self.github.max_posts, 3)
+
+        year = datetime.datetime.now().year
+        for i in range(1, 7):
+            comments = self.github.get_requests("POST", "/repos/CVEDB/test/issues/%d/comments" % i)
+            self.assertEqual(comments[0][4]["body"], "This issue has been assigned CVEDB-%s-100000%d" % (year, i))
+
+        commits = list(git.Repo(self.origin).iter_commits("main"))
+        self.assertEqual(len(commits[0].stats.files), 6)
+
+    def testSideEffectFailure(self):
+        # The issue GitHub won't let us comment on raises once the others
+        # are done, its ID is already pushed
+        self.github.routes["/repos/CVEDB/test/issues"] = [self.github.add_issue(i, body=issue_body())
+                                                          for i in range(1, 4)]
+        self.github.fail_paths["/repos/CVEDB/test/issues/2/comments"] = 422
+        self.bot.get_repo()
+        set_identity(self.bot.repo.repo)
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.bot.run_cycle()
+
+        for i in [1, 3]:
+            self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/%d/comments" % i)), 1)
+            self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/%d" % i)), 1)
+        self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/2")), 0)
+        commits = list(git.Repo(self.origin).iter_commits("main"))
+        self.assertEqual(len(commits[0].stats.files), 3)
+
+    def testRunParallel(self):
+        bot = CVEDB.Bot("CVEDB/test", workers=2)
+        lock = threading.Lock()
+        running = [0, 0]
+        done = []
+
+        def work(i):
+            with lock:
+                running[0] = running[0] + 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] = running[0] - 1
+            if i == 3:
+                raise Exception("Broken %d" % i)
+            done.append(i)
+
+        with self.assertRaisesRegex(Exception, "Broken 3"):
+            bot.run_parallel(work, range(8))
+        self.assertEqual(sorted(done), [0, 1, 2, 4, 5, 6, 7])
+        self.assertEqual(running[1], 2)
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.bot = CVEDB.Bot("CVEDB/test")
+        self.bot.run_cycle = lambda: self.work.pop(0)
+        self.work = []
+        self.daemon = CVEDB.Daemon(self.bot, 10, 60, webhook_port=0, webhook_secret="secret")
+        self.url = "http://127.0.0.1:%d/" % self.daemon.webhook_port
+
+    def tearDown(self):
+        self.daemon.stop()
+
+    def testInterval(self):
+        self.work = [0, 0, 0, 0, 3, 0]
+        self.assertEqual([self.daemon.run_once() for i in range(6)], [20, 40, 60, 60, 10, 20])
+
+    def testFailedCycle(self):
+        def broken():
+            raise Exception("Broken")
+        self.bot.run_cycle = broken
+        self.assertEqual(self.daemon.run_once(), 20)
+        self.assertEqual(self.bot.counters["failed_cycles"], 1)
+
+        with urllib.request.urlopen(self.url) as resp:
+            stats = json.loads(resp.read())
+        self.assertEqual(stats["last_error"], "Exception: Broken")
+
+    def testWebhook(self):
+        payload = b'{"action": "opened"}'
+        signature = "sha256=" + hmac.new(b"secret", payload, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(self.url, data=payload, headers={"X-Hub-Signature-256": signature})
+        with urllib.request.urlopen(request) as resp:
+            self.assertEqual(resp.status, 202)
+        self.assertTrue(self.daemon.wakeup.is_set())
+
+        self.daemon.wakeup.clear()
+        request = urllib.request.Request(self.url, data=payload, headers={"X-Hub-Signature-256": "sha256=bad"})
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(request)
+        self.assertFalse(self.daemon.wakeup.is_set())
+
+    def testStats(self):
+        with urllib.request.urlopen(self.url) as resp:
+            stats = json.loads(resp.read())
+        self.assertEqual(stats["counters"]["cycles"], 0)
+        self.assertEqual(stats["interval"], 10)
@@ -0,0 +1,152 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import tempfile
+import datetime
+import json
+import git
+
+import CVEDB
+from .test_CVEDBRepo import make_origin, set_identity
+
+def add_summary(the_id, the_data):
+    # Only the 2021 IDs need changing
+    if not the_id.startswith("CVEDB-2021"):
+        return None
+    the_data["OSV"]["summary"] = "Summary for %s" % the_id
+    return the_data
+
+def no_change(the_id, the_data):
+    return the_data
+
+def rename_osv(old_id, new_id, the_data):
+    the_data["OSV"]["id"] = new_id
+    return the_data
+
+class TestBulkRewrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        (self.work, self.origin) = make_origin(self.tmpdir.name)
+        self.repo = CVEDB.CVEDBRepo(self.origin, testing=True,
+                                    repo_dir=os.path.join(self.tmpdir.name, "checkout"))
+
+    def tearDown(self):
+        self.repo.close()
+        self.tmpdir.cleanup()
+
+    def testScanIDs(self):
+        year = str(datetime.datetime.now().year)
+        the_ids = [i[0] for i in CVEDB.scan_ids(self.repo.repo_dir)]
+        self.assertEqual(the_ids, ["CVEDB-2021-1000000", "CVEDB-2021-1000001", "CVEDB-%s-1000000" % year])
+
+    def testGetIndent(self):
+        self.assertEqual(CVEDB.get_indent(b'{\n  "a": 1\n}\n'), 2)
+        self.assertEqual(CVEDB.get_indent(b'{\n    "a": 1\n}\n'), 4)
+        self.assertEqual(CVEDB.get_indent(b'{"a": 1}'), None)
+
+    def testRewrite(self):
+        stats = self.repo.bulk_rewrite(add_summary, workers=2)
+        self.assertEqual(stats, {"scanned": 3, "changed": 2})
+
+        the_data = self.repo.get_id("CVEDB-2021-1000001")
+        self.assertEqual(the_data["OSV"]["summary"], "Summary for CVEDB-2021-1000001")
+        with open(self.repo.get_file("CVEDB-2021-1000001")) as fh:
+            self.assertEqual(fh.read(), json.dumps(the_data, indent=2) + "\n")
+
+        # Only the files that changed get staged
+        staged = sorted([i.a_path for i in self.repo.repo.index.diff("HEAD")])
+        self.assertEqual(staged, ["2021/1000xxx/CVEDB-2021-1000000.json",
+                                  "2021/1000xxx/CVEDB-2021-1000001.json"])
+
+    def testUnchanged(self):
+        # Returning the same data shouldn't touch anything
+        stats = self.repo.bulk_rewrite(no_change, workers=2)
+        self.assertEqual(stats, {"scanned": 3, "changed": 0})
+        self.assertEqual(len(self.repo.repo.index.diff("HEAD")), 0)
+
+    def testDryRun(self):
+        stats = self.repo.bulk_rewrite(add_summary, workers=2, dry_run=True)
+        self.assertEqual(stats["changed"], 2)
+        self.assertFalse("summary" in self.repo.get_id("CVEDB-2021-1000000")["OSV"])
+        self.assertEqual(len(self.repo.repo.index.diff("HEAD")), 0)
+
+class TestBulkRename(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repo_dir = self.tmpdir.name
+        self.repo = git.Repo.init(self.repo_dir)
+        set_identity(self.repo)
+
+        block_dir = os.path.join(self.repo_dir, "2021", "1000xxx")
+        os.makedirs(block_dir)
+        for i in range(5):
+            the_id = "UVI-2021-100000%d" % i
+            with open(os.path.join(block_dir, the_id + ".json"), "w") as fh:
+                fh.write(json.dumps({"OSV": {"id": the_id, "summary": "A much longer summary"}}, indent=2) + "\n")
+        with open(os.path.join(block_dir, "CVEDB-2021-1000009.json"), "w") as fh:
+            fh.write(json.dumps({"OSV": {"id": "CVEDB-2021-1000009"}}, indent=2) + "\n")
+        self.repo.git.add("-A")
+        self.repo.git.commit("-m", "Initial")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def get_file(self, the_id):
+        return os.path.join(self.repo_dir, "2021", "1000xxx", the_id + ".json")
+
+    def testRename(self):
+        stats = CVEDB.BulkRename(self.repo_dir, "UVI", "CVEDB", rename_osv, batch_size=2).run()
+        self.assertEqual(stats, {"renamed": 5, "resumed": 0, "staged": 5})
+
+        self.assertFalse(os.path.exists(self.get_file("UVI-2021-1000000")))
+        with open(self.get_file("CVEDB-2021-1000000")) as fh:
+            # The new data is shorter than the old, nothing can be left over
+            self.assertEqual(json.load(fh)["OSV"]["id"], "CVEDB-2021-1000000")
+
+        # Everything is staged, the old names are gone from the index
+        self.assertEqual(self.repo.git.status("--porcelain").count("??"), 0)
+        self.assertEqual(len(self.repo.index.diff(None)), 0)
+        paths = sorted([i[0] for i in self.repo.index.entries])
+        self.assertEqual(paths, ["2021/1000xxx/CVEDB-2021-100000%d.json" % i for i in [0, 1, 2, 3, 4, 9]])
+        self.assertFalse(os.path.exists(os.path.join(self.repo.git_dir, "cvedb-rename.journal")))
+
+    def testResume(self):
+        # Pretend the last run renamed one file and then died
+        os.replace(self.get_file("UVI-2021-1000003"), self.get_file("CVEDB-2021-1000003"))
+        with open(os.path.join(self.repo.git_dir, "cvedb-rename.journal"), "w") as fh:
+            fh.write("2021/1000xxx/UVI-2021-1000003.json\t2021/1000xxx/CVEDB-2021-1000003.json\n")
+            fh.write("2021/1000xxx/UVI-2021-10000")
+
+        stats = CVEDB.BulkRename(self.repo_dir, "UVI", "CVEDB", rename_osv).run()
+        self.assertEqual(stats, {"renamed": 4, "resumed": 1, "staged": 5})
+        self.assertEqual(len(self.repo.index.diff(None)), 0)
+        paths = sorted([i[0] for i in self.repo.index.entries])
+        self.assertEqual(paths, ["2021/1000xxx/CVEDB-2021-100000%d.json" % i for i in [0, 1, 2, 3, 4, 9]])
+
+    def testBrokenJournal(self):
+        # A record cut off after the tab and one that makes no sense don't
+        # count, and the cut off one is gone before we append to the file
+        journal_file = os.path.join(self.repo.git_dir, "cvedb-rename.journal")
+        good = "2021/1000xxx/UVI-2021-1000003.json\t2021/1000xxx/CVEDB-2021-1000003.json\n"
+        with open(journal_file, "w") as fh:
+            fh.write(good)
+            fh.write("2021/1000xxx/UVI-2021-1000001.json\t2021/1000xxx/CVEDB-2021-1000002.json\n")
+            fh.write("2021/1000xxx/UVI-2021-1000004.json\t2021/1000xxx/CVEDB-2021-10")
+
+        rename = CVEDB.BulkRename(self.repo_dir, "UVI", "CVEDB", rename_osv)
+        self.assertEqual(rename.load_journal(), [["2021/1000xxx/UVI-2021-1000003.json",
+                                                  "2021/1000xxx/CVEDB-2021-1000003.json"]])
+        with open(journal_file) as fh:
+            self.assertEqual(fh.read(), good + "2021/1000xxx/UVI-2021-1000001.json\t"
+                                               "2021/1000xxx/CVEDB-2021-1000002.json\n")
+
+        os.replace(self.get_file("UVI-2021-1000003"), self.get_file("CVEDB-2021-1000003"))
+        stats = rename.run()
+        self.assertEqual(stats, {"renamed": 4, "resumed": 1, "staged": 5})
+        self.assertEqual(len(self.repo.index.diff(None)), 0)
+        paths = sorted([i[0] for i in self.repo.index.entries])
+        self.assertEqual(paths, ["2021/1000xxx/CVEDB-2021-100000%d.json" % i for i in [0, 1, 2, 3, 4, 9]])
@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import tempfile
+
+import CVEDB
+from .fake_github import FakeGithub
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = CVEDB.ResponseCache(self.tmpdir.name)
+        self.github = FakeGithub()
+        self.session = CVEDB.GithubSession("cvedb-bot", "token", self.cache)
+
+    def tearDown(self):
+        self.github.close()
+        self.tmpdir.cleanup()
+
+    def testNotModified(self):
+        self.github.routes["/issues"] = [{"number": 1}]
+        resp = self.session.get(self.github.url + "/issues", params={"page": 1})
+        self.assertEqual(resp.json(), [{"number": 1}])
+        self.assertNotIn("If-None-Match", self.github.requests[-1][3])
+
+        resp = self.session.get(self.github.url + "/issues", params={"page": 1})
+        self.assertIn("If-None-Match", self.github.requests[-1][3])
+        self.assertEqual(resp.json(), [{"number": 1}])
+        self.assertTrue(resp.from_cache)
+
+        # Something changed, so we get the new data
+        self.github.routes["/issues"] = [{"number": 2}]
+        resp = self.session.get(self.github.url + "/issues", params={"page": 1})
+        self.assertEqual(resp.json(), [{"number": 2}])
+
+    def testPagesAreSeparate(self):
+        self.github.routes["/issues"] = [1, 2]
+        self.session.get(self.github.url + "/issues", params={"page": 1, "per_page": 1})
+        self.session.get(self.github.url + "/issues", params={"page": 2, "per_page": 1})
+
+        resp = self.session.get(self.github.url + "/issues", params={"page": 1, "per_page": 1})
+        self.assertTrue(resp.from_cache)
+        self.assertEqual(resp.json(), [1])
+        self.assertIn("next", resp.headers["Link"])
+
+    def testEviction(self):
+        self.cache.max_size = 1000
+        self.github.routes["/issues"] = ["x" * 100] * 20
+        for i in range(20):
+            self.session.get(self.github.url + "/issues", params={"page": i + 1, "per_page": 1})
+        self.assertLessEqual(self.cache.size, 1000)
+        self.assertEqual(self.cache.size, sum([i.stat().st_size for i in os.scandir(self.tmpdir.name)]))
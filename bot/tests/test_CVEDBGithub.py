@@ -3,40 +3,122 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from unittest.mock import Mock, patch
 
 import CVEDB
+from .fake_github import FakeGithub
 
-class FakeResponse:
+class TestCVEDBRepo(unittest.TestCase):
+
+    def setUp(self):
+        self.github = FakeGithub()
+        self.github.routes["/repos/CVEDB/test/issues"] = []
+        self.issues_url = self.github.url + "/repos/CVEDB/test/issues"
+        self.session = CVEDB.GithubSession("cvedb-bot", "token")
+
+    def tearDown(self):
+        self.github.close()
 
-    def __init__(self):
-        pass
+    def testGetNewIssues(self):
+        issues = CVEDB.get_new_issues(self.issues_url, self.session)
+        self.assertEqual(len(issues), 0)
 
-    def raise_for_status(self):
-        pass
+        self.github.routes["/repos/CVEDB/test/issues"] = [self.github.add_issue(1), self.github.add_issue(2)]
+        issues = CVEDB.get_new_issues(self.issues_url, self.session)
+        self.assertEqual([i.id for i in issues], [1, 2])
+        self.assertIs(issues[0].session, self.session)
 
-    def json(self):
-        return []
+        the_request = self.github.requests[-1]
+        self.assertEqual(the_request[2]["labels"], "new,check")
+        self.assertTrue(the_request[3]["Authorization"].startswith("Basic "))
 
-# This method will be used by the mock to replace requests.get
-def mocked_requests_get(*args, **kwargs):
-    # Same as above
-    return FakeResponse()
+    def testGetApprovedCan(self):
+        issues = CVEDB.get_approved_can_issues(self.issues_url, self.session)
+        self.assertEqual(len(issues), 0)
+        self.assertEqual(self.github.requests[-1][2]["labels"], "approved")
 
-class TestCVEDBRepo(unittest.TestCase):
+def graphql_issue(number, labels, comments=[], events=[], total_comments=None):
+    if total_comments is None:
+        total_comments = len(comments)
+    return {
+        "number": number,
+        "title": "Issue %d" % number,
+        "body": "body",
+        "url": "https://github.com/CVEDB/test/issues/%d" % number,
+        "author": {"login": "joshbressers", "databaseId": 1692786},
+        "labels": {"nodes": [{"name": i} for i in labels]},
+        "comments": {
+            "totalCount": total_comments,
+            "nodes": [{"body": i, "author": {"login": "cvedb-bot"}} for i in comments]
+        },
+        "timelineItems": {
+            "totalCount": len(events),
+            "nodes": [{"label": {"name": "approved"}, "actor": {"login": i[0], "databaseId": i[1]}} for i in events]
+        }
+    }
+
+def graphql_page(nodes, cursor=None):
+    return {
+        "data": {
+            "repository": {
+                "issues": {
+                    "pageInfo": {"hasNextPage": cursor is not None, "endCursor": cursor},
+                    "nodes": nodes
+                }
+            }
+        }
+    }
+
+class TestGraphQL(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.github = FakeGithub()
+        self.session = CVEDB.GithubSession("cvedb-bot", "token")
 
     def tearDown(self):
-        pass
+        self.github.close()
 
-    @patch('CVEDB.CVEDBGithub.requests.get', side_effect=mocked_requests_get)
-    def testGetNewIssues(self, mock_get):
-        issues = CVEDB.get_new_issues('http://example.com')
-        self.assertEqual(len(issues), 0)
+    def testGetIssues(self):
+        self.github.graphql = [
+            graphql_page([
+                graphql_issue(1, ["new", "check"]),
+                graphql_issue(2, ["new"])
+            ], "abc"),
+            graphql_page([
+                graphql_issue(3, ["check", "new"], comments=["This issue has been assigned CAN-2022-1000001"],
+                              events=[("kurtseifried", 582211)])
+            ])
+        ]
+        issues = CVEDB.get_issues_graphql("CVEDB/test", ["new", "check"], self.session,
+                                          api_url=self.github.url)
+        self.assertEqual([i.id for i in issues], [1, 3])
+        self.assertEqual(issues[1].creator_id, 1692786)
+        self.assertEqual(issues[1].events_url, self.github.url + "/repos/CVEDB/test/issues/3/events")
 
-    @patch('CVEDB.CVEDBGithub.requests.get', side_effect=mocked_requests_get)
-    def testGetApprovedCan(self, mock_get):
-        issues = CVEDB.get_approved_can_issues('http://example.com')
-        self.assertEqual(len(issues), 0)
+        # Everything came with the query, nothing else gets asked for
+        self.assertEqual(issues[1].get_cvedb_id(), "CAN-2022-1000001")
+        self.assertEqual(issues[1].who_approved(), "kurtseifried:582211")
+        posts = self.github.get_requests("POST", "/graphql")
+        self.assertEqual(len(posts), 2)
+        self.assertEqual(posts[1][4]["variables"]["cursor"], "abc")
+        self.assertEqual(len(self.github.requests), 2)
+
+    def testPartialComments(self):
+        self.github.graphql = [graphql_page([graphql_issue(1, ["approved"], comments=["last"], total_comments=150)])]
+        issues = CVEDB.get_issues_graphql("CVEDB/test", ["approved"], self.session, api_url=self.github.url)
+        self.github.routes["/repos/CVEDB/test/issues/1/comments"] = []
+        self.assertIsNone(issues[0].get_cvedb_id())
+        self.assertEqual(len(self.github.get_requests("GET", "/repos/CVEDB/test/issues/1/comments")), 1)
+
+    def testDeletedAuthor(self):
+        ghost = graphql_issue(2, ["approved"])
+        ghost["author"] = None
+        self.github.graphql = [graphql_page([graphql_issue(1, ["approved"]), ghost])]
+        issues = CVEDB.get_issues_graphql("CVEDB/test", ["approved"], self.session, api_url=self.github.url)
+        self.assertEqual([i.id for i in issues], [1, 2])
+        self.assertIsNone(issues[1].creator)
+        self.assertIsNone(issues[1].creator_id)
+
+    def testErrors(self):
+        self.github.graphql = [{"errors": [{"message": "Bad query"}]}]
+        with self.assertRaises(Exception):
+            CVEDB.get_issues_graphql("CVEDB/test", ["approved"], self.session, api_url=self.github.url)
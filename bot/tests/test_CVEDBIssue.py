@@ -3,35 +3,67 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
-from unittest.mock import Mock, patch
 
 import CVEDB
+from .fake_github import FakeGithub
 
-class FakeResponse:
+class TestGetPages(unittest.TestCase):
 
-    def __init__(self):
-        pass
+    def setUp(self):
+        self.github = FakeGithub()
+        self.session = CVEDB.GithubSession("cvedb-bot", "token")
+
+    def tearDown(self):
+        self.github.close()
 
-    def raise_for_status(self):
-        pass
+    def testGetPages(self):
+        comments = [{"id": i} for i in range(250)]
+        issue = CVEDB.Issue(self.github.add_issue(1, comments=comments), self.session)
+        self.assertEqual(issue.get_comments(), comments)
 
-    def json(self):
-        return []
+        # One request per page, none of them wasted
+        pages = [i[2]["page"] for i in self.github.get_requests("GET", "/repos/CVEDB/test/issues/1/comments")]
+        self.assertEqual(sorted(pages), ["1", "2", "3"])
 
-# This method will be used by the mock to replace requests.get
-def mocked_requests_get(*args, **kwargs):
-    # Same as above
-    return FakeResponse()
+    def testSinglePage(self):
+        events = [{"id": i} for i in range(3)]
+        issue = CVEDB.Issue(self.github.add_issue(1, events=events), self.session)
+        self.assertEqual(issue.get_events(), events)
+        self.assertEqual(len(self.github.requests), 1)
 
-class TestCVEDBRepo(unittest.TestCase):
+class TestIssueCache(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.github = FakeGithub()
+        self.session = CVEDB.GithubSession("cvedb-bot", "token")
+        body = "\n".join([
+            "Some words",
+            "--- CVEDB JSON ---",
+            '{"reporter": "joshbressers",',
+            ' "reporter_id": 1692786}',
+            "--- CVEDB JSON ---"
+        ])
+        comments = [{"user": {"login": "cvedb-bot"}, "body": "This issue has been assigned CAN-2022-1000001"}]
+        events = [{"event": "labeled", "label": {"name": "approved"}, "actor": {"login": "kurtseifried", "id": 582211}}]
+        self.issue = CVEDB.Issue(self.github.add_issue(1, body=body, comments=comments, events=events),
+                                 self.session)
 
     def tearDown(self):
-        pass
+        self.github.close()
+
+    def testCVEDBJson(self):
+        self.assertEqual(self.issue.get_reporter(), "joshbressers:1692786")
+        self.assertIs(self.issue.get_cvedb_json(), self.issue.get_cvedb_json())
+
+    def testCached(self):
+        for i in range(3):
+            self.assertEqual(self.issue.get_cvedb_id(), "CAN-2022-1000001")
+            self.assertEqual(self.issue.who_approved(), "kurtseifried:582211")
+        self.assertEqual(len(self.github.get_requests("GET", "/repos/CVEDB/test/issues/1/comments")), 1)
+        self.assertEqual(len(self.github.get_requests("GET", "/repos/CVEDB/test/issues/1/events")), 1)
 
-    @patch('CVEDB.CVEDBIssue.requests.get', side_effect=mocked_requests_get)
-    def testGetNewIssues(self, mock_get):
-        # These tests are going to be a bit rough
-        pass
+    def testInvalidate(self):
+        self.issue.get_cvedb_id()
+        self.issue.can_to_cvedb()
+        self.issue.get_cvedb_id()
+        self.assertEqual(len(self.github.get_requests("GET", "/repos/CVEDB/test/issues/1/comments")), 2)
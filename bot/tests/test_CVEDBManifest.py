@@ -0,0 +1,90 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import tempfile
+import datetime
+import json
+
+import CVEDB
+from .test_CVEDBRepo import make_origin, set_identity
+
+class TestIDManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        (self.work, self.origin) = make_origin(self.tmpdir.name)
+        self.repo_dir = os.path.join(self.tmpdir.name, "checkout")
+        self.year = str(datetime.datetime.now().year)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add_id(self, repo_dir, the_id):
+        (year, id_only) = the_id.split('-')[1:3]
+        block_dir = os.path.join(repo_dir, year, "%sxxx" % id_only[0:-3])
+        os.makedirs(block_dir, exist_ok=True)
+        with open(os.path.join(block_dir, the_id + ".json"), "w") as fh:
+            fh.write("{}")
+
+    def testRanges(self):
+        self.assertEqual(CVEDB.get_range(None), (None, None))
+        self.assertEqual(CVEDB.get_range("2021"), (2021, 2021))
+        self.assertEqual(CVEDB.get_range((2021, None)), (2021, None))
+        self.assertTrue(CVEDB.in_range(2022, (2021, None)))
+        self.assertFalse(CVEDB.in_range(2020, (2021, 2022)))
+        self.assertEqual(CVEDB.get_block("1000xxx"), 1000)
+        self.assertEqual(CVEDB.get_block("README.md"), None)
+
+    def testScan(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        self.add_id(self.repo_dir, "CVEDB-2021-1001000")
+        self.add_id(self.repo_dir, "CAN-2021-1001001")
+
+        self.assertEqual(repo.get_all_ids(), ["CVEDB-2021-1000000", "CVEDB-2021-1000001",
+                                              "CVEDB-2021-1001000", "CVEDB-%s-1000000" % self.year])
+        self.assertEqual(repo.get_all_ids(years=self.year), ["CVEDB-%s-1000000" % self.year])
+        self.assertEqual(repo.get_all_ids(years=2021, blocks=(1001, None)), ["CVEDB-2021-1001000"])
+
+        # It's a generator, nothing gets read until we ask
+        the_ids = repo.iter_ids()
+        self.assertEqual(next(the_ids), "CVEDB-2021-1000000")
+        repo.close()
+
+    def testManifest(self):
+        repo = CVEDB.CVEDBRepo("file://" + self.origin, testing=True, repo_dir=self.repo_dir,
+                               shallow=True, sparse=True)
+
+        # 2021 isn't checked out, but it's in the commit
+        self.assertEqual(repo.get_all_ids(years=2021), [])
+        self.assertEqual(repo.get_all_ids(years=2021, manifest=True),
+                         ["CVEDB-2021-1000000", "CVEDB-2021-1000001"])
+
+        manifest_file = os.path.join(repo.repo.git_dir, "cvedb-manifest.json")
+        with open(manifest_file) as fh:
+            self.assertEqual(json.load(fh)["head"], repo.repo.head.commit.hexsha)
+
+        # A new commit builds it again
+        self.add_id(self.repo_dir, "CVEDB-%s-1000001" % self.year)
+        set_identity(repo.repo)
+        repo.repo.git.add("-A")
+        repo.repo.git.commit("-m", "Add an ID")
+        self.assertEqual(repo.get_all_ids(years=self.year, manifest=True),
+                         ["CVEDB-%s-1000000" % self.year, "CVEDB-%s-1000001" % self.year])
+
+        # Another manifest reads the cached one
+        manifest = CVEDB.IDManifest(repo.repo, manifest_file)
+        manifest.load()
+        self.assertEqual(manifest.head, repo.repo.head.commit.hexsha)
+        repo.close()
+
+    def testManifestIgnoresIndex(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+
+        # Staged in the middle of a batch but not committed
+        self.add_id(self.repo_dir, "CVEDB-2021-1000002")
+        repo.repo.git.add("-A")
+        self.assertEqual(repo.get_all_ids(years=2021, manifest=True),
+                         ["CVEDB-2021-1000000", "CVEDB-2021-1000001"])
+        repo.close()
@@ -3,6 +3,11 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import unittest
+import tempfile
+import datetime
+import json
+import git
+from unittest.mock import patch
 
 import CVEDB
 
@@ -11,6 +16,7 @@ class FakeIssue:
     def __init__(self):
         self.cvedb = "CAN-1900-1000001"
         self.id = 1
+        self.html_url = "https://github.com/CVEDB/security-database/issues/1"
         self.json = {
             "vendor_name": "test vendor",
             "product_name": "test product",
@@ -113,3 +119,189 @@ class TestCVEDBRepo(unittest.TestCase):
 
         id_info = self.repo.get_id(the_id)
         self.assertEqual(id_info["OSV"]["id"], "CVEDB-1801-01")
+
+def set_identity(repo):
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Test")
+        config.set_value("user", "email", "test@example.com")
+
+def make_origin(the_dir):
+    # Build a small database we can clone without touching the network
+    work = os.path.join(the_dir, "work")
+    origin = os.path.join(the_dir, "origin.git")
+    repo = git.Repo.init(work)
+    repo.git.checkout("-b", "main")
+    set_identity(repo)
+
+    with open(os.path.join(work, "allowlist.json"), "w") as fh:
+        fh.write(json.dumps(["joshbressers:1692786"]))
+
+    year = str(datetime.datetime.now().year)
+    for the_id in ["CVEDB-2021-1000000", "CVEDB-2021-1000001", "CVEDB-%s-1000000" % year]:
+        id_year = the_id.split('-')[1]
+        block_dir = os.path.join(work, id_year, "1000xxx")
+        os.makedirs(block_dir, exist_ok=True)
+        with open(os.path.join(block_dir, the_id + ".json"), "w") as fh:
+            fh.write(json.dumps({"OSV": {"id": the_id}}, indent=2) + "\n")
+
+    repo.git.add("-A")
+    repo.git.commit("-m", "Initial")
+    git.Repo.clone_from(work, origin, bare=True)
+    return (work, origin)
+
+class TestCVEDBRepoPersistent(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        (self.work, self.origin) = make_origin(self.tmpdir.name)
+        self.repo_dir = os.path.join(self.tmpdir.name, "checkout")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testReuseCheckout(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        repo.close()
+        self.assertTrue(os.path.exists(os.path.join(self.repo_dir, ".git")))
+
+        # Leave some junk behind and push a new ID to the origin
+        junk = os.path.join(self.repo_dir, "2021", "1000xxx", "CVEDB-2021-1000002.json")
+        with open(junk, "w") as fh:
+            fh.write("{}")
+        origin_work = git.Repo.clone_from(self.origin, os.path.join(self.tmpdir.name, "other"))
+        set_identity(origin_work)
+        with open(os.path.join(origin_work.working_dir, "allowlist.json"), "w") as fh:
+            fh.write(json.dumps(["joshbressers:1692786", "newuser:1"]))
+        origin_work.index.add(["allowlist.json"])
+        origin_work.index.commit("Add newuser")
+        origin_work.remotes.origin.push()
+
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        self.assertFalse(os.path.exists(junk))
+        self.assertTrue(repo.approved_user("newuser:1"))
+        self.assertEqual(repo.repo.head.commit.hexsha, origin_work.head.commit.hexsha)
+        repo.close()
+
+    def testSparseCheckout(self):
+        repo = CVEDB.CVEDBRepo("file://" + self.origin, testing=True, repo_dir=self.repo_dir,
+                               shallow=True, sparse=True)
+        year = str(datetime.datetime.now().year)
+        self.assertTrue(os.path.exists(os.path.join(self.repo_dir, year)))
+        self.assertFalse(os.path.exists(os.path.join(self.repo_dir, "2021")))
+        self.assertTrue(repo.approved_user("joshbressers:1692786"))
+
+        # Older years get checked out when we need them
+        repo.add_year("2021")
+        self.assertTrue(os.path.exists(repo.get_file("CVEDB-2021-1000001")))
+        repo.close()
+
+    def testNextCVEDBPaths(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        year = str(datetime.datetime.now().year)
+        paths = repo.get_next_cvedb_paths(2, approved_user=True)
+        self.assertEqual(paths[0][0], "CVEDB-%s-1000001" % year)
+        self.assertEqual(paths[1][0], "CVEDB-%s-1000002" % year)
+        self.assertEqual(paths[1][1], repo.get_file("CVEDB-%s-1000002" % year))
+        the_id = repo.get_next_cvedb_path()
+        self.assertEqual(the_id[0], "CAN-%s-1000003" % year)
+        repo.close()
+
+    def testRefreshFreesPendingIDs(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        year = str(datetime.datetime.now().year)
+        repo.add_cvedb(FakeIssue())
+        self.assertEqual(repo.allocator.pending, ["CVEDB-%s-1000001" % year])
+
+        # The reset throws the uncommitted ID away, so we get it again
+        repo.refresh()
+        self.assertEqual(repo.allocator.pending, [])
+        self.assertEqual(repo.get_next_cvedb_path(True)[0], "CVEDB-%s-1000001" % year)
+        repo.close()
+
+        # Same for a new CVEDBRepo on the checkout
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        self.assertEqual(repo.get_next_cvedb_path(True)[0], "CVEDB-%s-1000001" % year)
+        repo.close()
+
+    def testBatch(self):
+        repo = CVEDB.CVEDBRepo(self.origin, repo_dir=self.repo_dir)
+        set_identity(repo.repo)
+
+        # Somebody else pushes while we're working
+        other = git.Repo.clone_from(self.origin, os.path.join(self.tmpdir.name, "other"))
+        set_identity(other)
+        with open(os.path.join(other.working_dir, "README.md"), "w") as fh:
+            fh.write("Hello\n")
+        other.index.add(["README.md"])
+        other.index.commit("Add README")
+        other.remotes.origin.push()
+
+        repo.start_batch()
+        first_id = repo.add_cvedb(FakeIssue())
+        second_id = repo.add_cvedb(FakeIssue())
+        repo.finish_batch()
+
+        origin = git.Repo(self.origin)
+        commits = list(origin.iter_commits("main"))
+        self.assertEqual(len(commits), 3)
+        self.assertEqual(commits[1].message, "Add README")
+        self.assertTrue(commits[0].message.startswith("Update 2 IDs"))
+        self.assertTrue(first_id in commits[0].message)
+        self.assertTrue(second_id in commits[0].message)
+        repo.close()
+
+    def testPushFailure(self):
+        repo = CVEDB.CVEDBRepo(self.origin, repo_dir=self.repo_dir)
+        set_identity(repo.repo)
+        repo.repo.remotes.origin.set_url(os.path.join(self.tmpdir.name, "missing.git"))
+
+        # Only a rejected push gets rebased and tried again
+        with patch.object(repo, "rebase") as rebase:
+            with self.assertRaises(git.exc.GitCommandError):
+                repo.push()
+            rebase.assert_not_called()
+        repo.close()
+
+    def testBatchSize(self):
+        repo = CVEDB.CVEDBRepo(self.origin, repo_dir=self.repo_dir)
+        set_identity(repo.repo)
+        repo.start_batch(2)
+        for i in range(3):
+            repo.add_cvedb(FakeIssue())
+        repo.finish_batch()
+
+        commits = list(git.Repo(self.origin).iter_commits("main"))
+        self.assertEqual(len(commits), 3)
+        self.assertTrue(commits[0].message.startswith("Add CVEDB-"))
+        self.assertTrue(commits[1].message.startswith("Update 2 IDs"))
+        repo.close()
+
+    def testAllowlist(self):
+        repo = CVEDB.CVEDBRepo(self.origin, testing=True, repo_dir=self.repo_dir)
+        self.assertTrue(repo.approved_user("joshbressers:1692786"))
+        self.assertTrue(repo.approved_user(user_name="joshbressers", user_id=1692786))
+        self.assertFalse(repo.approved_user("joshbressers:1"))
+        self.assertFalse(repo.approved_user("someone:1692786"))
+        self.assertFalse(repo.approved_user("baduser"))
+        self.assertFalse(repo.approved_user(None))
+        self.assertEqual(repo.allowed_logins["joshbressers"], 1692786)
+
+        # Nothing changed, so the file isn't read again
+        the_hash = repo.allowlist_hash
+        os.remove(os.path.join(self.repo_dir, "allowlist.json"))
+        repo.load_allowlist()
+        self.assertEqual(repo.allowlist_hash, the_hash)
+
+        other = git.Repo.clone_from(self.origin, os.path.join(self.tmpdir.name, "other"))
+        set_identity(other)
+        with open(os.path.join(other.working_dir, "allowlist.json"), "w") as fh:
+            fh.write(json.dumps(["kurtseifried:582211"]))
+        other.index.add(["allowlist.json"])
+        other.index.commit("Replace allowlist")
+        other.remotes.origin.push()
+
+        repo.refresh()
+        self.assertNotEqual(repo.allowlist_hash, the_hash)
+        self.assertTrue(repo.approved_user("kurtseifried:582211"))
+        self.assertFalse(repo.approved_user("joshbressers:1692786"))
+        repo.close()
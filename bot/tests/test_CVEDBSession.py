@@ -0,0 +1,98 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+import time
+import requests
+
+import CVEDB
+from .fake_github import FakeGithub
+
+class TestGithubSession(unittest.TestCase):
+
+    def setUp(self):
+        self.github = FakeGithub()
+        self.github.routes["/issues"] = [{"number": 1}]
+        self.session = CVEDB.GithubSession("cvedb-bot", "token", backoff=0.5)
+        self.sleeps = []
+        self.session.sleep = self.sleeps.append
+
+    def tearDown(self):
+        self.github.close()
+
+    def testRetryServerError(self):
+        self.github.failures = [(502, {}), (503, {})]
+        resp = self.session.get(self.github.url + "/issues")
+        self.assertEqual(resp.json(), [{"number": 1}])
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+    def testSecondaryRateLimit(self):
+        self.github.failures = [(403, {"Retry-After": "7"})]
+        resp = self.session.get(self.github.url + "/issues")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.sleeps, [7])
+
+    def testRateLimitWithoutReset(self):
+        self.github.failures = [(429, {"X-RateLimit-Remaining": "0"}), (403, {"X-RateLimit-Remaining": "0"})]
+        resp = self.session.get(self.github.url + "/issues")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+        # A POST that was turned away never happened, so it's sent again
+        self.github.failures = [(429, {"X-RateLimit-Remaining": "0"})]
+        issue = CVEDB.Issue(self.github.add_issue(1), self.session)
+        issue.add_comment("Hello")
+        self.assertEqual(len(self.github.get_requests("POST", "/repos/CVEDB/test/issues/1/comments")), 2)
+
+    def testGiveUp(self):
+        self.session.retries = 2
+        self.github.failures = [(500, {})] * 5
+        resp = self.session.get(self.github.url + "/issues")
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(len(self.github.requests), 3)
+
+    def testThrottle(self):
+        reset = int(time.time()) + 100
+        self.github.extra_headers = {"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": str(reset)}
+        self.session.get(self.github.url + "/issues")
+        self.assertEqual(self.session.remaining, 10)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertTrue(5 < self.sleeps[0] <= 10)
+
+        # Plenty left means no waiting
+        self.github.extra_headers = {"X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": str(reset)}
+        self.session.get(self.github.url + "/issues")
+        self.assertEqual(len(self.sleeps), 1)
+
+    def testPost(self):
+        # The comment might have been posted, so it isn't sent again
+        self.github.failures = [(502, {})]
+        issue = CVEDB.Issue(self.github.add_issue(1), self.session)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            issue.add_comment("Hello")
+        posts = self.github.get_requests("POST", "/repos/CVEDB/test/issues/1/comments")
+        self.assertEqual(posts[-1][4], {"body": "Hello"})
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def testPostRateLimit(self):
+        # A rate limited POST never happened, so it's safe to send again
+        self.github.failures = [(403, {"Retry-After": "7"}), (429, {"X-RateLimit-Remaining": "0",
+                                                                    "X-RateLimit-Reset": "0"})]
+        issue = CVEDB.Issue(self.github.add_issue(1), self.session)
+        issue.add_comment("Hello")
+        posts = self.github.get_requests("POST", "/repos/CVEDB/test/issues/1/comments")
+        self.assertEqual(len(posts), 3)
+        self.assertEqual(self.sleeps, [7, 1])
+
+    def testPostConnectionError(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.session.post("http://127.0.0.1:1/graphql", json={})
+        self.assertEqual(self.sleeps, [])
+
+        # A GraphQL query only reads, so it gets retried like a GET
+        self.session.retries = 1
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.session.post("http://127.0.0.1:1/graphql", json={}, idempotent=True)
+        self.assertEqual(self.sleeps, [0.5])
@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks')))
+
+import unittest
+import tempfile
+import importlib.util
+
+import CVEDB
+import corpus
+
+helpers_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'helpers'))
+
+def load_helper(filename):
+    # The helpers are scripts with dashes in their names
+    spec = importlib.util.spec_from_file_location(filename[0:-3].replace('-', '_'),
+                                                  os.path.join(helpers_dir, filename))
+    helper = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(helper)
+    return helper
+
+class TestHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        origin = os.path.join(self.tmpdir.name, "origin")
+        corpus.generate(origin, 20, years=["2021"])
+        self.repo = CVEDB.CVEDBRepo(origin, testing=True, repo_dir=os.path.join(self.tmpdir.name, "checkout"))
+
+    def tearDown(self):
+        self.repo.close()
+        self.tmpdir.cleanup()
+
+    def testAddOSVSummary(self):
+        helper = load_helper("add-osv-summary.py")
+        stats = self.repo.bulk_rewrite(helper.update_summary, workers=2)
+        self.assertEqual(stats["changed"], 20)
+
+        for the_id in self.repo.get_all_ids():
+            the_data = self.repo.get_id(the_id)
+            cvedb_data = the_data["CVEDB"]
+            if cvedb_data["vendor_name"] == "Linux" and cvedb_data["product_name"] == "Kernel":
+                summary = cvedb_data["description"].split('\n')[0]
+            else:
+                summary = "%s in %s version %s" % (cvedb_data["vulnerability_type"], cvedb_data["product_name"],
+                                                   cvedb_data["product_version"])
+            self.assertEqual(the_data["OSV"]["summary"], summary)
+
+        # Running it again changes nothing
+        stats = self.repo.bulk_rewrite(helper.update_summary, workers=2)
+        self.assertEqual(stats["changed"], 0)
+
+    def testUpdateOSVLinux(self):
+        helper = load_helper("update-osv-linux.py")
+        the_data = self.repo.get_id("CVEDB-2021-1000000")
+        the_data["CVEDB"]["vendor_name"] = "Linux"
+        the_data["CVEDB"]["product_name"] = "Kernel"
+        the_data["OSV"]["affected"][0]["package"]["ecosystem"] = "CVEDB"
+
+        the_data = helper.update_ecosystem("CVEDB-2021-1000000", the_data)
+        self.assertEqual(the_data["OSV"]["affected"][0]["package"]["ecosystem"], "Linux")
+        self.assertIsNone(helper.update_ecosystem("CVEDB-2021-1000000", the_data))
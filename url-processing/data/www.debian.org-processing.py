@@ -14,6 +14,7 @@
 # https://www.debian.org/security/2021/dsa-4885
 #
 import sys
+import os
 
 uvi_script_version = "0.1.2"
 uvi_script_name = sys.argv[0]
@@ -29,6 +30,9 @@ import scrapy
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from uvi_mirror import uvi_url_index, uvi_body_store
+
 with open(uvi_script_name,"rb") as f:
     bytes = f.read() # read entire file as bytes
     uvi_script_hash = hashlib.sha512(bytes).hexdigest();
@@ -50,6 +54,13 @@ with open(config_file) as config_data:
   uvi_config = json.load(config_data)
 global_uvi_url_downloads = uvi_config["global"]["uvi_url_downloads_repo"]
 
+#
+# What the mirror fetched, one read instead of a stat per URL
+#
+url_index = uvi_url_index(global_uvi_url_downloads + "/data/")
+url_states = url_index.load()
+body_store = uvi_body_store(global_uvi_url_downloads + "/data/")
+
 #
 # Take a URL, SHA512, find the path to the mirrored data
 #
@@ -64,14 +75,16 @@ with open(global_url_list) as file:
         h = hashlib.sha512()
         h.update(url_bytes)
         url_hash = h.hexdigest()
+        # Skip anything the mirror doesn't have a page for
+        url_state = url_states.get(url_hash)
+        if url_state is None or url_state.state != "fetched" or url_state.status != 200:
+            continue
         url_hash_1 = url_hash[0:2]
         url_hash_2 = url_hash[2:4]
         url_hash_3 = url_hash[4:6]
         url_hash_4 = url_hash[6:8]
 
         url_directory = global_uvi_url_downloads + "/data/" + url_hash_1 + "/" + url_hash_2 + "/" + url_hash_3 + "/" + url_hash_4 + "/" + url_hash
-        url_directory_raw_data = url_directory + "/raw-data"
-        url_raw_data = url_directory_raw_data + "/server_response.data"
         url_extracted_data_file = url_directory + "/extracted_data.json"
 
         # Version data is split across lines, 2-3 linmes, and can be multiple packages/versions within a line so we need to use scrapy, also differing fixed/unfixed/etc.
@@ -83,7 +96,7 @@ with open(global_url_list) as file:
 # '<p>For the unstable distribution (sid) these problems have been fixed in version\n85+dfsg-4.1</p>']
 # TODO: remove line return(s) and extract the distriburtion name, and the fixed in version X
 
-        with open(url_raw_data) as data_file1:
+        with body_store.open_response(url_hash, text=True) as data_file1:
             soup = BeautifulSoup(data_file1, "html.parser")
             #print(soup.title)
             for link in soup.findAll('a', attrs={'href': re.compile("^http")}):
@@ -135,7 +148,7 @@ with open(global_url_list) as file:
                 # (Multiple|Several) vulnerabilities (have been|were) discovered in
                 #
 
-        with open(url_raw_data) as data_file:
+        with body_store.open_response(url_hash, text=True) as data_file:
             #
             # ID:DSA
             # ID:CVE
@@ -1,24 +1,44 @@
 #!/usr/bin/env python3
 
-import hashlib
-# Requires Python 3.5 or later
+# Requires Python 3.7 or later
 from pathlib import Path
 
-import requests
-from requests.exceptions import RequestException
-import json
+import argparse
 import datetime
+import json
 import sys
 import os
 
-uvi_script_version = "0.0.3"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from uvi_mirror import uvi_mirror, uvi_url_index
+
+uvi_script_version = "0.1.0"
 uvi_script_name = sys.argv[0]
 
 #
-# Processa file with a list of URLs
+# Process a file with a list of URLs
 #
-global_url_list = sys.argv[1]
-
+arg_parser = argparse.ArgumentParser(description="Mirror a list of URLs into uvi-url-downloads")
+arg_parser.add_argument("url_list", help="File with one URL per line")
+arg_parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight at once")
+arg_parser.add_argument("--per-host", type=int, default=4, help="Requests in flight to one host at once")
+arg_parser.add_argument("--host-delay", type=float, default=0.0, help="Seconds between requests to one host")
+arg_parser.add_argument("--retries", type=int, default=3, help="Retries for connection errors, 429s and 5xx")
+arg_parser.add_argument("--timeout", type=int, default=10,
+                        help="Seconds to connect, or to wait for more data, before a request is abandoned")
+arg_parser.add_argument("--max-size", type=float, default=100,
+                        help="Megabytes, larger responses are dropped and recorded as an error")
+arg_parser.add_argument("--revalidate", action="store_true",
+                        help="Fetch URLs we already have again if they are older than --max-age")
+arg_parser.add_argument("--max-age", type=float, default=30, help="Days before a mirrored URL is stale")
+arg_parser.add_argument("--host-priority", action="append", default=[], metavar="HOST=N",
+                        help="Revalidate this host ahead of hosts with a lower N (default 0)")
+arg_parser.add_argument("--limit", type=int, default=None, help="Only revalidate this many URLs")
+arg_parser.add_argument("--rebuild-index", action="store_true",
+                        help="Build the already-seen index from the mirrored files before starting")
+args = arg_parser.parse_args()
+
+global_url_list = args.url_list
 
 #
 # Get the ~/.uvi/config.json and read it into uvi_config
@@ -26,114 +46,38 @@ global_url_list = sys.argv[1]
 home = str(Path.home())
 config_file = home + '/.uvi/config.json'
 with open(config_file) as config_data:
-  uvi_config = json.load(config_data)
+    uvi_config = json.load(config_data)
 global_uvi_url_downloads = uvi_config["global"]["uvi_url_downloads_repo"] + "/data/"
 
 #global_uvi_url_downloads = "/mnt/c/GitHub/uvi-url-downloads/data"
 
-with open(global_url_list) as file:
-    for line in file:
-        already_seen = False
-        url = line.rstrip()
-        url_bytes = url.encode()
-        h = hashlib.sha512()
-        h.update(url_bytes)
-        url_hash = h.hexdigest()
-        url_hash_1 = url_hash[0:2]
-        url_hash_2 = url_hash[2:4]
-        url_hash_3 = url_hash[4:6]
-        url_hash_4 = url_hash[6:8]
-
-        url_directory = global_uvi_url_downloads + "/" + url_hash_1 + "/" + url_hash_2 + "/" + url_hash_3 + "/" + url_hash_4 + "/" + url_hash
-        
-        url_directory_raw_data=url_directory + "/raw-data"
-        response_data_file = url_directory + "/response.json"
-
-        filepath_response_data_file = Path(response_data_file)
-        if filepath_response_data_file.is_file():
-            already_seen = True
-            print("already seen")
-        else:
-            Path(url_directory_raw_data).mkdir(parents=True, exist_ok=True)
-            print(url)
-        #
-        # TODO            
-        # if already_seen == True:
-        #
-        # Logic to check timestamp and get again if over X timestamp
-
-        if already_seen == False:
-            timestamp = datetime.datetime.utcnow() # <-- get time in UTC
-            request_timestamp = timestamp.isoformat("T") + "Z"
-
-            request_succeeded = False
-            request_error = ""
-            try:
-              # get file
-              response = requests.get(url, allow_redirects=True, timeout=10)
-              request_succeeded = True
-            except requests.exceptions.RequestException as request_error:  # This is the correct syntax
-              get_request_error = str(request_error)
-              request_succeeded = False
-
-
-            # Only print a response body to the file if it worked
-            if request_succeeded == True:
-              #response_dict = json.loads(response.text)
-              response_file = url_directory_raw_data + "/server_response.data"
-              f = open(response_file, "wb")
-              f.write(response.content)
-              f.close()
-            #
-            # Request file data ALWAYS WRITE
-            #
-            request_data_file = url_directory + "/request.json"
-            request_data = {
-              "URL_requested": url,
-              "TIMESTAMP": request_timestamp,
-              "uvi_script_name": uvi_script_name,
-              "uvi_script_version": uvi_script_version
-            }
-            f = open(request_data_file, "w")
-            f.write(json.dumps(request_data, indent=4, sort_keys=True))
-            f.close()
-            #
-            # Remove old txt file if exists
-            #
-            request_data_file_txt = url_directory + "/request.txt"
-            if os.path.exists(request_data_file_txt):
-              os.remove(request_data_file_txt)
-            #
-            # Response file data
-            #
-            # TODO: add logic, check if request_error is not "" and write http error otherwise right the proper file:
-            #
-            #response_data_file = url_directory + "/response.json"
-            f = open(response_data_file, "w")
-
-            # IF ERROR
-            if request_succeeded == False:
-              response_data = {
-                "error": get_request_error
-                }
-            if request_succeeded == True:
-              # IF NO ERROR
-              response_data = {
-                "elapsed": str(response.elapsed),
-                "is_redirect": str(response.is_redirect),
-                "status_code": str(response.status_code),
-                "url": response.url,
-                "response_file": response_file
-              }
-              
-            f.write(json.dumps(response_data, indent=4, sort_keys=True))
-            f.close()
-            #
-            # Remove old txt file if exists
-            #
-            response_data_file_txt = url_directory + "/response.txt"
-            if os.path.exists(response_data_file_txt):
-              os.remove(response_data_file_txt)
-
-
-          
+def read_urls(url_list):
+    with open(url_list) as file:
+        for line in file:
+            url = line.rstrip()
+            if url != "":
+                yield url
+
+host_priority = {}
+for priority in args.host_priority:
+    (host, value) = priority.split("=", 1)
+    host_priority[host] = int(value)
+
+if args.rebuild_index:
+    # Opening the index builds it if it isn't there, so this only walks the
+    # mirror once either way
+    uvi_url_index(global_uvi_url_downloads, rebuild=True).close()
+
+mirror = uvi_mirror(global_uvi_url_downloads, uvi_script_name, uvi_script_version,
+                    concurrency=args.concurrency, per_host=args.per_host, host_delay=args.host_delay,
+                    retries=args.retries, timeout=args.timeout, revalidate=args.revalidate,
+                    max_age=datetime.timedelta(days=args.max_age), host_priority=host_priority,
+                    max_size=int(args.max_size * 1000000))
+
+if args.revalidate:
+    # Work out what's stale first so the oldest and most important URLs go first
+    urls = mirror.plan(read_urls(global_url_list))[0:args.limit]
+    print("Revalidating %d URLs" % len(urls))
+else:
+    urls = read_urls(global_url_list)
+mirror.run(urls)
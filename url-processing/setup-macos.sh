@@ -4,4 +4,4 @@ echo "Setting up Mac OS"
 
 # Going to assume homebrew is installed with python3
 
-pip3 install scrapy bs4
+pip3 install scrapy bs4 aiohttp
@@ -2,6 +2,6 @@
 
 echo "Setting up Ubuntu"
 
-sudo apt-get install python3-scrapy
+sudo apt-get install python3-scrapy python3-aiohttp
 
 # bs4?
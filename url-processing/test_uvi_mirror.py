@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import tempfile
+import unittest
+
+from aiohttp import web
+
+from uvi_mirror import uvi_mirror, uvi_url_index, uvi_body_store, get_url_hash, get_url_directory, read_json
+
+#
+# Runs the mirror against a small aiohttp server on 127.0.0.1
+#
+# python3 -m unittest test_uvi_mirror
+#
+
+class fake_server():
+
+    def __init__(self):
+        self.fail = False
+        self.hits = {}
+        self.app = web.Application()
+        self.app.router.add_get("/page", self.page)
+        self.app.router.add_get("/same/{name}", self.same)
+        self.app.router.add_get("/flaky", self.flaky)
+        self.app.router.add_get("/chunked", self.chunked)
+        self.app.router.add_get("/slow", self.slow)
+
+    async def start(self):
+        self.release = asyncio.Event()
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = "http://127.0.0.1:%d" % self.runner.addresses[0][1]
+
+    async def stop(self):
+        self.release.set()
+        await self.runner.cleanup()
+
+    def count(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+
+    async def page(self, request):
+        self.count(request)
+        if self.fail:
+            return web.Response(status=503)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+        return web.Response(body=b"the page\n", headers={"ETag": '"v1"'})
+
+    async def same(self, request):
+        self.count(request)
+        return web.Response(body=b"the same body\n")
+
+    async def flaky(self, request):
+        self.count(request)
+        if self.hits[request.path] == 1:
+            return web.Response(status=503)
+        return web.Response(body=b"worked the second time\n")
+
+    async def chunked(self, request):
+        # No Content-Length, the size is only known as it streams
+        self.count(request)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(40):
+            await response.write(b"x" * 65536)
+        return response
+
+    async def slow(self, request):
+        self.count(request)
+        await self.release.wait()
+        return web.Response(body=b"too late\n")
+
+class test_uvi_mirror(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.downloads_dir = self.tmpdir.name + "/data/"
+        self.server = fake_server()
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+        self.tmpdir.cleanup()
+
+    def get_mirror(self, **kwargs):
+        return uvi_mirror(self.downloads_dir, "test_uvi_mirror.py", "0.1.0", concurrency=4, retries=1,
+                          backoff=0.01, report_interval=1000, **kwargs)
+
+    def get_response(self, url):
+        return read_json(get_url_directory(self.downloads_dir, get_url_hash(url)) + "/response.json")
+
+    async def test_fetch(self):
+        url = self.server.url + "/page"
+        stats = await self.get_mirror().run_async([url])
+        self.assertEqual(stats["fetched"], 1)
+        response_data = self.get_response(url)
+        self.assertEqual(response_data["status_code"], "200")
+        self.assertEqual(response_data["etag"], '"v1"')
+        with uvi_body_store(self.downloads_dir).open_response(get_url_hash(url)) as f:
+            self.assertEqual(f.read(), b"the page\n")
+
+        # Already seen, nothing gets asked for
+        stats = await self.get_mirror().run_async([url])
+        self.assertEqual(stats["already_seen"], 1)
+        self.assertEqual(self.server.hits["/page"], 1)
+
+    async def test_retry(self):
+        url = self.server.url + "/flaky"
+        stats = await self.get_mirror().run_async([url])
+        self.assertEqual(stats["fetched"], 1)
+        self.assertEqual(self.server.hits["/flaky"], 2)
+        self.assertEqual(self.get_response(url)["status_code"], "200")
+
+    async def test_revalidate(self):
+        url = self.server.url + "/page"
+        await self.get_mirror().run_async([url])
+        response_data = self.get_response(url)
+
+        # Stale, the server says nothing changed
+        stats = await self.get_mirror(revalidate=True).run_async([url])
+        self.assertEqual(stats["not_modified"], 1)
+        self.assertEqual(self.server.hits["/page"], 2)
+        revalidated_data = self.get_response(url)
+        self.assertGreater(revalidated_data.pop("checked"), response_data.pop("checked"))
+        self.assertEqual(revalidated_data, response_data)
+        with uvi_body_store(self.downloads_dir).open_response(get_url_hash(url)) as f:
+            self.assertEqual(f.read(), b"the page\n")
+
+    async def test_revalidate_failure(self):
+        url = self.server.url + "/page"
+        await self.get_mirror().run_async([url])
+        response_data = self.get_response(url)
+
+        # A 5xx keeps the copy we have
+        self.server.fail = True
+        stats = await self.get_mirror(revalidate=True).run_async([url])
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["fetched"], 0)
+        failed_data = self.get_response(url)
+        self.assertEqual(failed_data["body_hash"], response_data["body_hash"])
+        self.assertEqual(failed_data["etag"], '"v1"')
+        self.assertEqual(failed_data["last_error"], "HTTP 503")
+
+        url_state = uvi_url_index(self.downloads_dir).load()[get_url_hash(url)]
+        self.assertEqual(url_state.state, "fetched")
+        self.assertEqual(url_state.status, 200)
+        self.assertEqual(url_state.etag, '"v1"')
+
+        # So does a server that's gone
+        await self.server.stop()
+        stats = await self.get_mirror(revalidate=True).run_async([url])
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(self.get_response(url)["body_hash"], response_data["body_hash"])
+        with uvi_body_store(self.downloads_dir).open_response(get_url_hash(url)) as f:
+            self.assertEqual(f.read(), b"the page\n")
+
+    async def test_index_rebuild(self):
+        urls = [self.server.url + "/page", self.server.url + "/missing"]
+        await self.get_mirror().run_async(urls)
+
+        # A mirror without an index gets one built from response.json
+        os.remove(self.downloads_dir + "url_index.sqlite")
+        stats = await self.get_mirror().run_async(urls)
+        self.assertEqual(stats["already_seen"], 2)
+        url_states = uvi_url_index(self.downloads_dir).load()
+        self.assertEqual(url_states[get_url_hash(urls[0])].etag, '"v1"')
+        self.assertEqual(url_states[get_url_hash(urls[1])].status, 404)
+
+        # A rebuild keeps the time of the last revalidation
+        await self.get_mirror(revalidate=True).run_async(urls[0:1])
+        checked = uvi_url_index(self.downloads_dir).load()[get_url_hash(urls[0])].checked
+        self.assertEqual(self.get_response(urls[0])["checked"], checked)
+        url_states = uvi_url_index(self.downloads_dir, rebuild=True).load()
+        self.assertEqual(url_states[get_url_hash(urls[0])].checked, checked)
+
+    async def test_interrupted(self):
+        # What finished before the crawl was stopped is in the index
+        urls = [self.server.url + "/page", self.server.url + "/slow"]
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.get_mirror().run_async(urls), 1)
+        url_states = uvi_url_index(self.downloads_dir).load()
+        self.assertEqual(list(url_states.keys()), [get_url_hash(urls[0])])
+
+    async def test_shared_blob(self):
+        urls = [self.server.url + "/same/one", self.server.url + "/same/two"]
+        stats = await self.get_mirror().run_async(urls)
+        self.assertEqual(stats["fetched"], 2)
+        body_hashes = [self.get_response(url)["body_hash"] for url in urls]
+        self.assertEqual(body_hashes[0], body_hashes[1])
+
+        blobs = []
+        for (root, dirs, files) in os.walk(self.downloads_dir + "blobs"):
+            blobs.extend(i for i in files if i.endswith(".gz"))
+        self.assertEqual(blobs, [body_hashes[0] + ".gz"])
+
+        store = uvi_body_store(self.downloads_dir)
+        for url in urls:
+            with store.open_response(get_url_hash(url), text=True) as f:
+                self.assertEqual(f.read(), "the same body\n")
+
+    async def test_size_cap(self):
+        url = self.server.url + "/chunked"
+        stats = await self.get_mirror(max_size=1000000).run_async([url])
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(self.get_response(url)["error"], "Response is larger than 1000000 bytes")
+        self.assertEqual(os.listdir(self.downloads_dir + "blobs/tmp"), [])
+        self.assertFalse(os.path.exists(self.downloads_dir + "blobs/" + "00"))
+
+        # Without the cap it all gets streamed into the store
+        stats = await self.get_mirror(revalidate=True).run_async([url])
+        self.assertEqual(stats["fetched"], 1)
+        self.assertEqual(self.get_response(url)["body_size"], 40 * 65536)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import hashlib
+import tempfile
+import datetime
+import threading
+import collections
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+#
+# Shared code for mirroring URLs into the uvi-url-downloads layout:
+#
+# data/aa/bb/cc/dd/<sha512 of the URL>/request.json
+# data/aa/bb/cc/dd/<sha512 of the URL>/response.json
+# data/blobs/aa/bb/<sha512 of the body>.gz
+# data/url_index.sqlite
+#
+# Older mirrors kept every body in raw-data/server_response.data under the
+# URL directory, those still read fine through uvi_body_store.
+#
+
+def get_url_hash(url):
+    return hashlib.sha512(url.encode()).hexdigest()
+
+def get_url_directory(downloads_dir, url_hash):
+    return downloads_dir + "/" + url_hash[0:2] + "/" + url_hash[2:4] + "/" + url_hash[4:6] + "/" + url_hash[6:8] + "/" + url_hash
+
+def get_timestamp():
+    return datetime.datetime.utcnow().isoformat("T") + "Z"
+
+def parse_timestamp(timestamp):
+    return datetime.datetime.fromisoformat(timestamp.rstrip("Z"))
+
+def read_json(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(filename, data):
+    with open(filename, "w") as f:
+        f.write(json.dumps(data, indent=4, sort_keys=True))
+
+def get_checked_time(url_directory):
+    # Returns (response_data, when we last heard from the server), both are
+    # None if we never fetched the URL. Older mirrors only have the request
+    # timestamp
+    response_data = read_json(url_directory + "/response.json")
+    if response_data is None:
+        return (None, None)
+    if "checked" in response_data:
+        return (response_data, response_data["checked"])
+    request_data = read_json(url_directory + "/request.json")
+    if request_data is not None and "TIMESTAMP" in request_data:
+        return (response_data, request_data["TIMESTAMP"])
+    return (response_data, datetime.datetime.min.isoformat("T") + "Z")
+
+#
+# What we know about every URL we mirrored, so planning a crawl is one
+# read of a small SQLite file instead of opening response.json under four
+# levels of directories for every URL. Updates are batched into
+# transactions as fetches finish, a batch is written once it's full or a
+# second old so a killed crawl loses at most that much. If the index is
+# missing it gets built from the response.json files once.
+#
+uvi_url_state = collections.namedtuple("uvi_url_state", ["state", "status", "checked", "etag", "last_modified"])
+
+def get_url_state(response_data, checked):
+    if "error" in response_data:
+        return uvi_url_state("error", None, checked, None, None)
+    status = response_data.get("status_code")
+    if status is not None:
+        status = int(status)
+    return uvi_url_state("fetched", status, checked, response_data.get("etag"), response_data.get("last_modified"))
+
+class uvi_url_index():
+
+    def __init__(self, downloads_dir, batch_size=500, flush_interval=1.0, rebuild=False):
+        self.downloads_dir = downloads_dir
+        self.index_file = downloads_dir + "/url_index.sqlite"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+        new_index = not os.path.exists(self.index_file)
+        Path(downloads_dir).mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.index_file)
+        self.db.execute("CREATE TABLE IF NOT EXISTS urls (url_hash TEXT PRIMARY KEY, url TEXT, state TEXT, "
+                        "status INTEGER, checked TEXT, etag TEXT, last_modified TEXT)")
+        if new_index or rebuild:
+            self.rebuild()
+
+    def rebuild(self):
+        # Walks the mirror once, reading every response.json
+        self.db.execute("DELETE FROM urls")
+        for (root, dirs, files) in os.walk(self.downloads_dir):
+            if "blobs" in dirs:
+                dirs.remove("blobs")
+            if "response.json" not in files:
+                continue
+            dirs.clear()
+            (response_data, checked) = get_checked_time(root)
+            request_data = read_json(root + "/request.json") or {}
+            if response_data is not None:
+                self.update(os.path.basename(root), request_data.get("URL_requested"),
+                            get_url_state(response_data, checked))
+        self.flush()
+
+    def load(self):
+        # Returns {url_hash: uvi_url_state} for every URL we have
+        cursor = self.db.execute("SELECT url_hash, state, status, checked, etag, last_modified FROM urls")
+        return {row[0]: uvi_url_state(*row[1:]) for row in cursor}
+
+    def update(self, url_hash, url, url_state):
+        self.pending.append((url_hash, url) + tuple(url_state))
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?, ?)", self.pending)
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+#
+# Response bodies, stored once per content hash and gzipped, so the same
+# page behind several URLs only takes the space once. response.json has
+# the body_hash. Read bodies with open_response() rather than opening the
+# files, it knows both layouts.
+#
+class uvi_body_store():
+
+    def __init__(self, downloads_dir):
+        self.downloads_dir = downloads_dir
+        self.blobs_dir = downloads_dir + "/blobs"
+
+    def get_blob_file(self, body_hash):
+        return self.blobs_dir + "/" + body_hash[0:2] + "/" + body_hash[2:4] + "/" + body_hash + ".gz"
+
+    def new_blob(self):
+        return uvi_blob_writer(self)
+
+    def put(self, body):
+        # Returns the body hash
+        blob = self.new_blob()
+        blob.write(body)
+        return blob.commit()[0]
+
+    def open(self, body_hash, text=False):
+        return gzip.open(self.get_blob_file(body_hash), "rt" if text else "rb")
+
+    def open_response(self, url_hash, text=False):
+        # Returns the body the mirror saved for a URL, None if there isn't one
+        url_directory = get_url_directory(self.downloads_dir, url_hash)
+        response_data = read_json(url_directory + "/response.json")
+        if response_data is None:
+            return None
+        if "body_hash" in response_data:
+            return self.open(response_data["body_hash"], text)
+        if "response_file" in response_data:
+            return open(url_directory + "/raw-data/server_response.data", "r" if text else "rb")
+        return None
+
+#
+# Writes one body into the store a chunk at a time, hashing and gzipping it
+# as it goes. The data goes to a temp file under blobs/tmp and only gets
+# renamed to its hash on commit(), so a half written blob never shows up
+# and two mirrors writing the same body don't get in each other's way.
+# The mirror calls these from a thread pool so gzip doesn't hold up the
+# event loop, the lock keeps an abort() from closing a file mid write.
+#
+class uvi_blob_writer():
+
+    def __init__(self, store):
+        self.store = store
+        self.hash = hashlib.sha512()
+        self.size = 0
+        temp_dir = store.blobs_dir + "/tmp"
+        Path(temp_dir).mkdir(parents=True, exist_ok=True)
+        (fd, self.temp_file) = tempfile.mkstemp(dir=temp_dir, suffix=".gz")
+        self.raw_file = os.fdopen(fd, "wb")
+        # Level 6 is most of the saving of 9 for a lot less CPU
+        self.gzip_file = gzip.GzipFile(fileobj=self.raw_file, mode="wb", compresslevel=6)
+        self.lock = threading.Lock()
+
+    def write(self, chunk):
+        with self.lock:
+            self.hash.update(chunk)
+            self.size = self.size + len(chunk)
+            self.gzip_file.write(chunk)
+
+    def close(self):
+        with self.lock:
+            self.gzip_file.close()
+            self.raw_file.close()
+
+    def commit(self):
+        # Returns (body_hash, body_size)
+        self.close()
+        body_hash = self.hash.hexdigest()
+        blob_file = self.store.get_blob_file(body_hash)
+        if os.path.exists(blob_file):
+            os.unlink(self.temp_file)
+        else:
+            Path(blob_file).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.temp_file, blob_file)
+        return (body_hash, self.size)
+
+    def abort(self):
+        self.close()
+        Path(self.temp_file).unlink(missing_ok=True)
+
+#
+# The mirror engine, fetches a lot of URLs at the same time over a few
+# reused connections. There's a global limit on requests in flight, a
+# smaller limit per host, and an optional delay between requests to the
+# same host so we stay polite. Connection errors, 429s and 5xx get retried
+# with a jittered backoff. Bodies are streamed into the store, so a fetch
+# only holds one chunk in memory, and anything over max_size is dropped.
+#
+# With revalidate set, URLs we already have get fetched again once they're
+# older than max_age. Those requests send the ETag/Last-Modified we saved,
+# so an unchanged page is a 304 and we only update the checked time, in
+# the index and in response.json. If revalidating fails we keep the copy
+# we have.
+#
+class uvi_mirror():
+
+    def __init__(self, downloads_dir, script_name, script_version, concurrency=64, per_host=4,
+                 host_delay=0.0, retries=3, backoff=1.0, timeout=10, report_interval=10,
+                 revalidate=False, max_age=None, host_priority=None, max_size=None, chunk_size=65536):
+        self.downloads_dir = downloads_dir
+        self.script_name = script_name
+        self.script_version = script_version
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.report_interval = report_interval
+        self.revalidate = revalidate
+        self.max_age = max_age
+        self.host_priority = host_priority or {}
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.index = None
+        self.seen = None
+        self.store = uvi_body_store(downloads_dir)
+
+        self.host_semaphores = {}
+        self.host_next_request = {}
+
+        self.stats = {
+            "fetched": 0,
+            "failed": 0,
+            "already_seen": 0,
+            "not_modified": 0,
+            "bytes": 0
+        }
+        self.start_time = None
+        self.last_report = None
+
+    def get_host_semaphore(self, host):
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.host_semaphores[host]
+
+    async def wait_for_host(self, host):
+        # Space out the requests to one host by host_delay
+        if self.host_delay <= 0:
+            return
+        now = time.monotonic()
+        next_request = max(self.host_next_request.get(host, now), now)
+        self.host_next_request[host] = next_request + self.host_delay
+        await asyncio.sleep(next_request - now)
+
+    def get_retry_delay(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            return int(retry_after)
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def load_index(self):
+        if self.index is None:
+            self.index = uvi_url_index(self.downloads_dir)
+            self.seen = self.index.load()
+
+    def is_stale(self, url_state):
+        if self.max_age is None:
+            return True
+        return datetime.datetime.utcnow() - parse_timestamp(url_state.checked) > self.max_age
+
+    def get_conditional_headers(self, url_state):
+        headers = {}
+        if url_state.state != "fetched":
+            return headers
+        if url_state.etag is not None:
+            headers["If-None-Match"] = url_state.etag
+        if url_state.last_modified is not None:
+            headers["If-Modified-Since"] = url_state.last_modified
+        return headers
+
+    def plan(self, urls):
+        # Returns the URLs to fetch: never fetched first, then the stalest,
+        # with higher priority hosts ahead of the rest
+        self.load_index()
+        planned = []
+        for url in urls:
+            url_state = self.seen.get(get_url_hash(url))
+            if url_state is None:
+                checked = ""
+            elif not self.revalidate or not self.is_stale(url_state):
+                self.stats["already_seen"] = self.stats["already_seen"] + 1
+                continue
+            else:
+                checked = url_state.checked
+            priority = self.host_priority.get(urlsplit(url).hostname, 0)
+            planned.append((-priority, checked, url))
+        planned.sort()
+        return [i[2] for i in planned]
+
+    def record(self, url_hash, url, url_state):
+        self.seen[url_hash] = url_state
+        self.index.update(url_hash, url, url_state)
+
+    def check_size(self, size):
+        if self.max_size is not None and size > self.max_size:
+            raise ValueError("Response is larger than %d bytes" % self.max_size)
+
+    async def download(self, response):
+        # Returns (body_hash, body_size)
+        if response.content_length is not None:
+            self.check_size(response.content_length)
+        # Hashing, gzipping and writing happen in the default executor so
+        # the other fetches keep going while we compress
+        loop = asyncio.get_running_loop()
+        blob = await loop.run_in_executor(None, self.store.new_blob)
+        try:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                await loop.run_in_executor(None, blob.write, chunk)
+                self.check_size(blob.size)
+        except BaseException:
+            blob.abort()
+            raise
+        return await loop.run_in_executor(None, blob.commit)
+
+    async def get(self, session, url, headers=None, revalidating=False):
+        # Returns (response, body_hash, body_size), raises the last error if
+        # we ran out of retries. When we're revalidating a copy we have, only
+        # a 2xx body gets stored
+        host = urlsplit(url).hostname
+        async with self.get_host_semaphore(host):
+            for attempt in range(self.retries + 1):
+                await self.wait_for_host(host)
+                try:
+                    async with session.get(url, allow_redirects=True, headers=headers) as response:
+                        if (response.status == 429 or response.status >= 500) and attempt < self.retries:
+                            await asyncio.sleep(self.get_retry_delay(attempt, response.headers.get("Retry-After")))
+                            continue
+                        if revalidating and not 200 <= response.status < 300:
+                            return (response, None, 0)
+                        (body_hash, body_size) = await self.download(response)
+                        return (response, body_hash, body_size)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(self.get_retry_delay(attempt))
+
+    async def fetch(self, session, url):
+        url_hash = get_url_hash(url)
+        url_directory = get_url_directory(self.downloads_dir, url_hash)
+
+        url_state = self.seen.get(url_hash)
+        headers = None
+        if url_state is not None:
+            if not self.revalidate or not self.is_stale(url_state):
+                self.stats["already_seen"] = self.stats["already_seen"] + 1
+                print("already seen")
+                return
+            headers = self.get_conditional_headers(url_state)
+        revalidating = url_state is not None and url_state.state == "fetched"
+
+        Path(url_directory).mkdir(parents=True, exist_ok=True)
+        print(url)
+
+        request_timestamp = get_timestamp()
+        start_time = time.monotonic()
+        try:
+            (response, body_hash, body_size) = await self.get(session, url, headers, revalidating)
+            request_succeeded = True
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as request_error:
+            get_request_error = str(request_error) or type(request_error).__name__
+            request_succeeded = False
+
+        if request_succeeded == True and response.status == 304 and revalidating:
+            # Nothing changed, keep the body we have. The checked time goes
+            # in response.json too so a rebuilt index still has it
+            response_data = read_json(url_directory + "/response.json")
+            if response_data is not None:
+                response_data["checked"] = request_timestamp
+                write_json(url_directory + "/response.json", response_data)
+            self.record(url_hash, url, url_state._replace(checked=request_timestamp))
+            self.stats["not_modified"] = self.stats["not_modified"] + 1
+            self.report()
+            return
+
+        if revalidating and (request_succeeded == False or not 200 <= response.status < 300):
+            # Keep the copy we have, a server having a bad day shouldn't
+            # throw it away. We note what went wrong and try again once
+            # it's stale
+            if request_succeeded == True:
+                get_request_error = "HTTP %d" % response.status
+            response_data = read_json(url_directory + "/response.json")
+            if response_data is not None:
+                response_data["last_error"] = get_request_error
+                response_data["last_error_time"] = request_timestamp
+                response_data["checked"] = request_timestamp
+                write_json(url_directory + "/response.json", response_data)
+            self.record(url_hash, url, url_state._replace(checked=request_timestamp))
+            self.stats["failed"] = self.stats["failed"] + 1
+            self.report()
+            return
+
+        # The body lives in the store now
+        if request_succeeded == True:
+            Path(url_directory + "/raw-data/server_response.data").unlink(missing_ok=True)
+
+        #
+        # Request file data ALWAYS WRITE
+        #
+        write_json(url_directory + "/request.json", {
+            "URL_requested": url,
+            "TIMESTAMP": request_timestamp,
+            "uvi_script_name": self.script_name,
+            "uvi_script_version": self.script_version
+        })
+        #
+        # Remove old txt file if exists
+        #
+        Path(url_directory + "/request.txt").unlink(missing_ok=True)
+
+        if request_succeeded == False:
+            response_data = {
+                "error": get_request_error,
+                "checked": request_timestamp
+            }
+            self.stats["failed"] = self.stats["failed"] + 1
+        else:
+            response_data = {
+                "elapsed": str(datetime.timedelta(seconds=time.monotonic() - start_time)),
+                "is_redirect": str(response.status in (301, 302, 303, 307, 308) and "Location" in response.headers),
+                "status_code": str(response.status),
+                "url": str(response.url),
+                "body_hash": body_hash,
+                "body_size": body_size,
+                "checked": request_timestamp
+            }
+            # What we need to ask the server if it changed next time
+            if "ETag" in response.headers:
+                response_data["etag"] = response.headers["ETag"]
+            if "Last-Modified" in response.headers:
+                response_data["last_modified"] = response.headers["Last-Modified"]
+            self.stats["fetched"] = self.stats["fetched"] + 1
+            self.stats["bytes"] = self.stats["bytes"] + body_size
+
+        write_json(url_directory + "/response.json", response_data)
+        Path(url_directory + "/response.txt").unlink(missing_ok=True)
+        self.record(url_hash, url, get_url_state(response_data, request_timestamp))
+
+        self.report()
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        seconds = max(now - self.start_time, 0.001)
+        done = self.stats["fetched"] + self.stats["failed"] + self.stats["not_modified"]
+        print("Fetched %d URLs (%d failed, %d not modified, %d already seen) in %.0fs, %.1f URLs/s, %.2f MB/s" % (
+            done, self.stats["failed"], self.stats["not_modified"], self.stats["already_seen"], seconds,
+            done / seconds, self.stats["bytes"] / seconds / 1000000), file=sys.stderr)
+
+    async def worker(self, session, queue):
+        while True:
+            url = await queue.get()
+            try:
+                await self.fetch(session, url)
+            except OSError as e:
+                # Disk trouble with one URL shouldn't stop the others
+                print("Error mirroring %s: %s" % (url, e), file=sys.stderr)
+            finally:
+                queue.task_done()
+
+    async def run_async(self, urls):
+        self.load_index()
+        self.start_time = time.monotonic()
+        self.last_report = self.start_time
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        # The timeout is for connecting and for each read, a big body can take
+        # as long as it needs while data keeps coming
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                # A bounded queue so we don't read the whole URL list up front
+                queue = asyncio.Queue(self.concurrency * 2)
+                workers = [asyncio.create_task(self.worker(session, queue)) for i in range(self.concurrency)]
+                try:
+                    for url in urls:
+                        await queue.put(url)
+                    await queue.join()
+                finally:
+                    for task in workers:
+                        task.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            # Whatever finished gets into the index, even if we were stopped
+            self.index.flush()
+        self.report(force=True)
+        return self.stats
+
+    def run(self, urls):
+        return asyncio.run(self.run_async(urls))